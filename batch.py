@@ -0,0 +1,88 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from fixtures import Fixtures
+from routingsolver import get_solver
+
+SCENARIO_COLUMNS = ['league_id', 'year', 'league_country', 'origin_airport', 'min_int_match']
+""" Columns of the scenario file, one scenario per row. An optional backend column overrides the solver backend """
+
+
+def _solve_scenario(fix, backend):
+    """ Solve one scenario in a worker process
+        Returns the tour (None if there is no trip), its trip duration and travel time and the solve time in seconds
+    """
+    t0 = time.perf_counter()
+    model = get_solver(fix, backend)
+    model._solve_model()
+    solve_time = time.perf_counter() - t0
+    if model.tour is None:
+        return None, None, None, solve_time
+    return (model.tour,) + model._tour_objectives() + (solve_time,)
+
+
+def run_scenarios(scenario_path, foot_api_key, route_api_key, output_path='Scenario Results.csv',
+                  backend='labelsetting', processes=None, cache_path='match_routing_cache.sqlite', client=None,
+                  geolocator=None):
+    """ Solve every scenario of a CSV file and write all the results to one CSV file
+        Fixtures are pulled and geocoded once per league and season. Scenarios are grouped by min_int_match, which
+        recomputes every successor, and within it each origin airport only recomputes the airport row and column of
+        the travel matrix and the arcs of Start and End. Solves are spread over a pool of processes. Results are
+        written in the order of the scenario file. client and geolocator are passed to Fixtures, for instance to run
+        against local stub servers
+    """
+    scenarios = pd.read_csv(scenario_path)
+    if 'backend' not in scenarios:
+        scenarios['backend'] = backend
+    scenarios = scenarios.sort_values(['league_id', 'year', 'league_country', 'min_int_match', 'origin_airport'],
+                                      kind='stable')
+
+    results, futures, rows = [], [], []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for (league_id, year, league_country), league in scenarios.groupby(
+                ['league_id', 'year', 'league_country'], sort=False):
+            fix = None
+            for _, scenario in league.iterrows():
+                t0 = time.perf_counter()
+                if fix is None:
+                    fix = Fixtures(foot_api_key, route_api_key, league_id, year, scenario['origin_airport'],
+                                   league_country, scenario['min_int_match'], cache_path=cache_path,
+                                   client=client, geolocator=geolocator)
+                    fix._pull_fixtures()
+                else:
+                    """ A new min_int_match recomputes every arc, a new origin only those of Start and End """
+                    if scenario['min_int_match'] != fix.min_int_match:
+                        fix._set_min_int_match(scenario['min_int_match'])
+                    if scenario['origin_airport'] != fix.airport_origin:
+                        fix._set_origin(scenario['origin_airport'])
+                rows.append(scenario.name)
+                results.append({column: scenario[column] for column in SCENARIO_COLUMNS + ['backend']})
+                results[-1]['prepare s'] = time.perf_counter() - t0
+                futures.append(executor.submit(_solve_scenario, fix._view(), scenario['backend']))
+
+        for result, future in zip(results, futures):
+            tour, travel_duration, travel_time, solve_time = future.result()
+            result['status'] = 'solved' if tour is not None else 'infeasible'
+            result['travel duration'] = travel_duration
+            result['travel time'] = travel_time
+            result['trip'] = ' -> '.join(tour) if tour is not None else ''
+            result['solve s'] = solve_time
+
+    output = pd.DataFrame(results, index=rows).sort_index()
+    output.to_csv(output_path, index=False)
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Solve the Match Routing Problem for every scenario of a CSV file "
+                                                 "with columns " + ", ".join(SCENARIO_COLUMNS))
+    parser.add_argument('scenarios', help="scenario CSV file")
+    parser.add_argument('--football-key', default="API Key", help="Football API key")
+    parser.add_argument('--route-key', default="API Key", help="Route and Directions API key")
+    parser.add_argument('--output', default='Scenario Results.csv', help="consolidated results CSV file")
+    parser.add_argument('--backend', default='labelsetting', help="solver backend, see routingsolver.SOLVERS")
+    parser.add_argument('--processes', type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+    print(run_scenarios(args.scenarios, args.football_key, args.route_key, args.output, args.backend,
+                        args.processes))
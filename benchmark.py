@@ -0,0 +1,456 @@
+import argparse
+import json
+import os
+import threading
+import time
+import random
+import resource
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from fixtures import Fixtures
+from routingsolver import get_solver
+
+
+KICKOFFS = (timedelta(hours=12, minutes=30), timedelta(hours=15), timedelta(hours=17, minutes=30),
+            timedelta(days=1, hours=14), timedelta(days=1, hours=16, minutes=30))
+""" Kickoff times of the synthetic leagues, from the Saturday of each round """
+
+PHASE_COLUMNS = ['fixture build s', 'travel times s', 'successors s', 'variables s', 'constraints s', 'objective s',
+                 'warm start s', 'solve s', 'outputs s']
+""" Phases timed by benchmark_phases, variables, constraints, objective and warm start are only timed for the gurobi
+    backends. Their solve s excludes the warm start heuristic, add both to compare with the other backends """
+
+
+def synthetic_matches(n_teams, rounds=None, kickoffs=KICKOFFS, kickoff_weights=None, spread=(4.0, 4.0),
+                      centre=(52.5, -1.5), seed=0):
+    """ Matches of a synthetic league, in the format of Fixtures._build_fixtures
+        Teams play a round robin every week, home and away in alternate cycles, for rounds weeks (a double round
+        robin by default, later cycles repeat the pairs as cup ties do). Kickoffs are drawn from kickoffs, with
+        kickoff_weights if given, and grounds are spread uniformly over spread degrees of latitude and longitude
+        around centre
+    """
+    rnd = random.Random(seed)
+    teams = ['Team {0}'.format(n) for n in range(n_teams + n_teams % 2)]
+    coordinates = {team: (rnd.uniform(centre[0] - spread[0] / 2, centre[0] + spread[0] / 2),
+                          rnd.uniform(centre[1] - spread[1] / 2, centre[1] + spread[1] / 2)) for team in teams}
+    first_round = pd.Timestamp('2022-08-06', tz='UTC')
+    rotation = teams[1:]
+    cycle = []
+    for r in range(len(teams) - 1):
+        order = [teams[0]] + rotation
+        cycle.append([(order[n], order[-1 - n]) for n in range(len(teams) // 2)])
+        rotation = rotation[-1:] + rotation[:-1]
+    cycle += [[(away, home) for home, away in games] for games in cycle]
+    rounds = len(cycle) if rounds is None else rounds
+    matches = []
+    for r in range(rounds):
+        for home, away in cycle[r % len(cycle)]:
+            if n_teams % 2 and teams[-1] in (home, away):
+                continue
+            kickoff = rnd.choice(kickoffs) if kickoff_weights is None else rnd.choices(kickoffs, kickoff_weights)[0]
+            matches.append({'date': first_round + timedelta(weeks=r) + kickoff,
+                            'home team': home, 'away team': away, 'stadium': home + ' Stadium',
+                            'stadium name': home + ' Stadium', 'stadium city': home + ' City',
+                            'stadium lat': coordinates[home][0], 'stadium lon': coordinates[home][1]})
+    return matches
+
+
+def _synthetic_fixtures(min_int_match):
+    """ Empty Fixtures instance for synthetic matches, without API keys or cache
+    """
+    fix = Fixtures(None, None, 0, 2022, 'Origin Airport', 'Synthetic', min_int_match, cache_path=None)
+    fix.airport_lat, fix.airport_lon = 51.47, -0.45
+    return fix
+
+
+def synthetic_league(n_teams, min_int_match=12, seed=0, **kwargs):
+    """ Build a Fixtures instance for a synthetic league without calling any API
+        By default a double round robin played weekly, with kickoffs spread over the weekend. Other keyword arguments
+        are passed to synthetic_matches
+    """
+    fix = _synthetic_fixtures(min_int_match)
+    fix._build_fixtures(synthetic_matches(n_teams, seed=seed, **kwargs))
+    fix._get_travel_times()
+    fix._get_time_between_matches()
+    return fix
+
+
+def benchmark_model_build(league_sizes=(10, 16, 20, 24, 30, 40)):
+    """ Time the construction of variables, constraints and objectives against the league size
+    """
+    from fixtureschedulingmodel import FixtureSchedulingModel
+    print('{0:>6} {1:>8} {2:>9} {3:>12} {4:>13} {5:>11}'.format(
+        'teams', 'matches', 'arcs', 'variables s', 'constraints s', 'objective s'))
+    for n_teams in league_sizes:
+        fix = synthetic_league(n_teams)
+        model = FixtureSchedulingModel(fix)
+        t0 = time.perf_counter()
+        model._define_variables()
+        t1 = time.perf_counter()
+        model._define_constraints()
+        t2 = time.perf_counter()
+        model._define_objective_function()
+        t3 = time.perf_counter()
+        print('{0:>6} {1:>8} {2:>9} {3:>12.3f} {4:>13.3f} {5:>11.3f}'.format(
+            n_teams, len(fix.matches_id), len(fix.arcs), t1 - t0, t2 - t1, t3 - t2))
+
+
+def benchmark_solvers(league_sizes=(6, 8, 10, 16, 20), backends=('gurobi', 'labelsetting', 'windows')):
+    """ Time each solver backend end to end against the league size, with the objectives of the trip found
+    """
+    print('{0:>6} {1:>13} {2:>9} {3:>10} {4:>12}'.format('teams', 'backend', 'solve s', 'duration', 'travel time'))
+    for n_teams in league_sizes:
+        fix = synthetic_league(n_teams)
+        for backend in backends:
+            model = get_solver(fix, backend)
+            t0 = time.perf_counter()
+            model._solve_model()
+            t1 = time.perf_counter()
+            if model.tour is None:
+                print('{0:>6} {1:>13} {2:>9.3f} {3:>10} {4:>12}'.format(n_teams, backend, t1 - t0, '-', '-'))
+            else:
+                print('{0:>6} {1:>13} {2:>9.3f} {3:>10.1f} {4:>12.2f}'.format(
+                    n_teams, backend, t1 - t0, *model._tour_objectives()))
+
+
+def benchmark_warm_start(league_sizes=(6, 8, 10, 16, 20)):
+    """ Time to first feasible solution, solve time and final gaps of the MIP with and without the heuristic warm start
+        The gaps are those of each pass of the multi-objective search, trip duration and then travel time, from the
+        incumbent and bound Gurobi reports at the end of the pass
+    """
+    from fixtureschedulingmodel import FixtureSchedulingModel
+    print('{0:>6} {1:>10} {2:>16} {3:>9} {4:>10} {5:>12} {6:>10}'.format(
+        'teams', 'warm start', 'first feasible s', 'solve s', 'duration', 'duration gap', 'travel gap'))
+    for n_teams in league_sizes:
+        fix = synthetic_league(n_teams)
+        for warm_start in (False, True):
+            model = FixtureSchedulingModel(fix, warm_start=warm_start)
+            model.opt_model.Params.OutputFlag = 0
+            t0 = time.perf_counter()
+            model._solve_model()
+            t1 = time.perf_counter()
+            first_feasible = '-' if model.time_to_first_feasible is None else round(model.time_to_first_feasible, 3)
+            duration = '-' if model.tour is None else round(model._tour_objectives()[0], 1)
+            gaps = ['-' if model.pass_gaps.get(name) is None else '{0:.2%}'.format(model.pass_gaps[name])
+                    for name in ('travel_duration', 'travel_time')]
+            print('{0:>6} {1:>10} {2:>16} {3:>9.3f} {4:>10} {5:>12} {6:>10}'.format(
+                n_teams, str(warm_start), first_feasible, t1 - t0, duration, *gaps))
+
+
+def benchmark_reschedule(league_sizes=(6, 8, 10), days=3):
+    """ Time the re-solve after one match of the trip is moved by days, updating the live model against rebuilding it
+    """
+    from fixtureschedulingmodel import FixtureSchedulingModel
+    print('{0:>6} {1:>13} {2:>14} {3:>12} {4:>13}'.format('teams', 'arcs changed', 'update model s', 'optimize s',
+                                                       'rebuild s'))
+    for n_teams in league_sizes:
+        fix = synthetic_league(n_teams)
+        model = FixtureSchedulingModel(fix)
+        model.opt_model.Params.OutputFlag = 0
+        model._solve_model()
+        if model.tour is None:
+            continue
+        match = model.tour[len(model.tour) // 2]
+        t0 = time.perf_counter()
+        removed, added = model._update_model({match: {'date': fix.fixtures_dict['date'][match] + timedelta(days=days)}})
+        t1 = time.perf_counter()
+        rebuild = FixtureSchedulingModel(fix)
+        rebuild.opt_model.Params.OutputFlag = 0
+        t2 = time.perf_counter()
+        rebuild._solve_model()
+        t3 = time.perf_counter()
+        print('{0:>6} {1:>13} {2:>14.3f} {3:>12.3f} {4:>13.3f}'.format(
+            n_teams, len(removed) + len(added), t1 - t0 - model.opt_model.Runtime, model.opt_model.Runtime, t3 - t2))
+
+
+def _measure_build(builder, n_teams):
+    """ Build the model of a synthetic league with builder, in a fresh process
+        Returns the build time in seconds and the growth of the peak resident memory in MB while building
+    """
+    fix = synthetic_league(n_teams)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    model = builder(fix)
+    model._define_variables()
+    model._define_constraints()
+    model._define_objective_function()
+    model._set_objective_function()
+    model.opt_model.update()
+    t1 = time.perf_counter()
+    return t1 - t0, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak) / 1024
+
+
+def benchmark_matrix_build(league_sizes=(10, 16, 20, 24, 30)):
+    """ Build time and peak memory of the per-arc builder against the matrix builder
+    """
+    from fixtureschedulingmodel import FixtureSchedulingModel
+    from matrixschedulingmodel import MatrixFixtureSchedulingModel
+    print('{0:>6} {1:>9} {2:>9} {3:>9} {4:>11} {5:>11}'.format(
+        'teams', 'arcs', 'arcs s', 'matrix s', 'arcs MB', 'matrix MB'))
+    for n_teams in league_sizes:
+        results = []
+        for builder in (FixtureSchedulingModel, MatrixFixtureSchedulingModel):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results.append(executor.submit(_measure_build, builder, n_teams).result())
+        print('{0:>6} {1:>9} {2:>9.3f} {3:>9.3f} {4:>11.1f} {5:>11.1f}'.format(
+            n_teams, len(synthetic_league(n_teams).arcs), results[0][0], results[1][0], results[0][1], results[1][1]))
+
+
+def _measure_phases(n_teams, backend, min_int_match, league_kwargs):
+    """ Run every phase on a synthetic league in a fresh process, writing the outputs in a temporary directory
+        Returns the row of benchmark_phases
+    """
+    result = {'teams': n_teams, 'backend': backend, 'min int match': min_int_match}
+    matches = synthetic_matches(n_teams, **league_kwargs)
+    fix = _synthetic_fixtures(min_int_match)
+    for phase, routine in (('fixture build s', lambda: fix._build_fixtures(matches)),
+                           ('travel times s', fix._get_travel_times),
+                           ('successors s', fix._get_time_between_matches)):
+        t0 = time.perf_counter()
+        routine()
+        result[phase] = time.perf_counter() - t0
+    result['matches'] = len(fix.matches_id) - 2
+    result['arcs'] = len(fix.successor_targets)
+
+    model = get_solver(fix, backend)
+    if backend in ('gurobi', 'gurobi-matrix'):
+        model.opt_model.Params.OutputFlag = 0
+        for phase, routine in (('variables s', model._define_variables),
+                               ('constraints s', model._define_constraints),
+                               ('objective s', model._define_objective_function)):
+            t0 = time.perf_counter()
+            routine()
+            result[phase] = time.perf_counter() - t0
+        model._set_objective_function()
+        if model.warm_start:
+            t0 = time.perf_counter()
+            model._set_warm_start()
+            result['warm start s'] = time.perf_counter() - t0
+        solve = model._optimize
+    else:
+        solve = model._solve_model
+    t0 = time.perf_counter()
+    solve()
+    result['solve s'] = time.perf_counter() - t0
+    if model.tour is not None:
+        result['travel duration'], result['travel time'] = model._tour_objectives()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                t0 = time.perf_counter()
+                model._get_outputs()
+                result['outputs s'] = time.perf_counter() - t0
+            finally:
+                os.chdir(cwd)
+    result['peak MB'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """ Local stand-in for the HTTP APIs used by check_http_client
+        /ok answers, /flaky fails with 503 once then answers, /missing is a 404, /down always fails with 503 and
+        /search answers as Nominatim
+    """
+    calls = {}
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.calls[path] = self.calls.get(path, 0) + 1
+        if path == '/ok' or (path == '/flaky' and self.calls[path] > 1):
+            self._send(200, {'ok': True})
+        elif path == '/search':
+            self._send(200, [{'lat': '51.5', 'lon': '-0.1', 'display_name': 'Stub Stadium', 'place_id': 1}])
+        elif path in ('/flaky', '/down'):
+            self._send(503, {'message': 'unavailable'}, {'Retry-After': '0'})
+        else:
+            self._send(404, {'message': 'not found'})
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for key, value in dict(headers or {}, **{'Content-Type': 'application/json'}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def check_http_client():
+    """ Run HttpClient and geocoding against a local stub server: a success, a retried 503, error statuses raising
+        requests.HTTPError and a Nominatim geocoder pointed at the stub
+    """
+    import requests
+    from geopy.adapters import RequestsAdapter
+    from geopy.geocoders import Nominatim
+    from httpclient import HttpClient
+    from telemetry import Telemetry
+    from utils import geocode
+    _StubHandler.calls = {}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{0}'.format(server.server_port)
+    try:
+        telemetry = Telemetry()
+        client = HttpClient(retries=2, backoff=0, telemetry=telemetry)
+        assert client.get_json(url + '/ok') == {'ok': True}
+        assert client.get_json(url + '/flaky') == {'ok': True}
+        assert telemetry.counters['http retries default'] == 1
+        for path in ('/missing', '/down'):
+            try:
+                client.get_json(url + path)
+            except requests.HTTPError:
+                pass
+            else:
+                raise AssertionError("GET {0} returned the error body".format(path))
+        assert _StubHandler.calls['/down'] == client.retries + 1
+        geolocator = Nominatim(user_agent='match routing check', domain=url[len('http://'):], scheme='http',
+                               adapter_factory=RequestsAdapter)
+        assert geocode(geolocator, 'Stub Stadium', client=client) == (51.5, -0.1)
+    finally:
+        server.shutdown()
+        server.server_close()
+    print('http client ok')
+
+
+def _reference_successors(fix):
+    """ possible_successor computed by the original double loop over the matches, with pandas dates
+    """
+    possible_successor = {}
+    for m1 in fix.matches_id:
+        possible_successor[m1] = []
+        t1 = fix.fixtures_dict['home team'][m1]
+        s1 = (fix.fixtures_dict['date'][m1] - fix.start_league).total_seconds() / (60 * 60)
+        for m2 in fix.matches_id:
+            t2 = fix.fixtures_dict['home team'][m2]
+            s2 = (fix.fixtures_dict['date'][m2] - fix.start_league).total_seconds() / (60 * 60)
+            if m1 != m2 and s1 + max(fix.travel_times[(t1, t2)], fix.min_int_match) <= s2:
+                possible_successor[m1].append(m2)
+    return possible_successor
+
+
+def check_successors(cases=((6, 0), (8, 12), (20, 12), (20, 40))):
+    """ Check that the vectorized successors match the reference loop exactly, for (teams, min_int_match) cases,
+        over several blocks, after a new min_int_match and after a rescheduled match
+    """
+    import fixtures
+    for n_teams, min_int_match in cases:
+        fix = synthetic_league(n_teams, min_int_match=min_int_match)
+        assert fix.possible_successor == _reference_successors(fix), (n_teams, min_int_match)
+        block = fixtures.SUCCESSOR_BLOCK
+        fixtures.SUCCESSOR_BLOCK = 37
+        try:
+            fix._set_min_int_match(min_int_match + 1)
+        finally:
+            fixtures.SUCCESSOR_BLOCK = block
+        assert fix.possible_successor == _reference_successors(fix), (n_teams, min_int_match + 1)
+        match = fix.matches_id[len(fix.matches_id) // 2]
+        fix._update_fixtures({match: {'date': fix.fixtures_dict['date'][match] + timedelta(days=2)}})
+        assert fix.successor_set == {k: set(v) for k, v in _reference_successors(fix).items()}, (n_teams, match)
+    print('successors ok')
+
+
+def check_builders(league_sizes=(6, 8), seeds=(0, 1)):
+    """ Check that the per-arc and matrix Gurobi builders give the same model size and the same tour, before and after
+        a rescheduled match. Skipped without gurobipy
+    """
+    try:
+        from fixtureschedulingmodel import FixtureSchedulingModel
+        from matrixschedulingmodel import MatrixFixtureSchedulingModel
+    except ImportError:
+        print('builders skipped, gurobipy is not installed')
+        return
+    for n_teams in league_sizes:
+        for seed in seeds:
+            tours = []
+            for builder in (FixtureSchedulingModel, MatrixFixtureSchedulingModel):
+                fix = synthetic_league(n_teams, seed=seed)
+                model = builder(fix)
+                model.opt_model.Params.OutputFlag = 0
+                model._solve_model()
+                result = [model.opt_model.NumVars, model.opt_model.NumConstrs, model.tour]
+                match = model.tour[len(model.tour) // 2]
+                model._update_model({match: {'date': fix.fixtures_dict['date'][match] + timedelta(days=2)}})
+                tours.append(result + [model.tour])
+            assert tours[0] == tours[1], (n_teams, seed, tours)
+    print('builders ok')
+
+
+def run_checks():
+    """ Regression checks of the claims the benchmarks rely on, the repo has no test suite
+    """
+    check_http_client()
+    check_successors()
+    check_builders()
+
+
+def _revision():
+    """ Short hash of the checked out git commit, or an empty string outside a git repository
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def benchmark_phases(league_sizes=(10, 16, 20, 24, 30, 40), backend='heuristic', min_int_match=12,
+                     output_path='Benchmark Results.csv', **league_kwargs):
+    """ Time each phase of a run and the peak memory on synthetic leagues, one fresh process per league size
+        Phases are the fixture build, _get_travel_times, _get_time_between_matches, the variables, constraints,
+        objective and warm start of the gurobi backends, the solve and _get_outputs. Rows are appended to the CSV file
+        at output_path with the run time and the git commit, so regressions and the scaling curve can be followed
+        across changes.
+        Other keyword arguments are passed to synthetic_matches
+    """
+    run = pd.Timestamp.now(tz='UTC').isoformat(timespec='seconds')
+    revision = _revision()
+    results = []
+    for n_teams in league_sizes:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(_measure_phases, n_teams, backend, min_int_match, league_kwargs).result()
+        results.append(dict(run=run, commit=revision, **result))
+    columns = ['run', 'commit', 'teams', 'matches', 'arcs', 'backend', 'min int match'] + PHASE_COLUMNS + \
+        ['peak MB', 'travel duration', 'travel time']
+    output = pd.DataFrame(results).reindex(columns=columns)
+    if output_path is not None:
+        output.to_csv(output_path, mode='a', header=not os.path.exists(output_path), index=False)
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Match Routing Problem on synthetic leagues")
+    parser.add_argument('--teams', type=int, nargs='+', default=[10, 16, 20, 24, 30, 40], help="league sizes")
+    parser.add_argument('--backend', default='heuristic', help="solver backend, see routingsolver.SOLVERS")
+    parser.add_argument('--min-int-match', type=float, default=12, help="minimum hours between two matches")
+    parser.add_argument('--rounds', type=int, default=None, help="weekly rounds, a double round robin by default")
+    parser.add_argument('--spread', type=float, nargs=2, default=[4.0, 4.0],
+                        help="degrees of latitude and longitude the grounds are spread over")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the synthetic leagues")
+    parser.add_argument('--output', default='Benchmark Results.csv', help="CSV file the results are appended to")
+    parser.add_argument('--tables', action='store_true',
+                        help="also print the backend, warm start, reschedule and builder comparisons, "
+                             "which need a Gurobi license")
+    parser.add_argument('--check', action='store_true',
+                        help="only run the regression checks (run_checks) and exit")
+    args = parser.parse_args()
+    if args.check:
+        run_checks()
+        raise SystemExit
+    pd.set_option('display.width', 200)
+    print(benchmark_phases(args.teams, args.backend, args.min_int_match, args.output, rounds=args.rounds,
+                           spread=tuple(args.spread), seed=args.seed))
+    if args.tables:
+        benchmark_model_build()
+        benchmark_solvers()
+        benchmark_warm_start()
+        benchmark_reschedule()
+        benchmark_matrix_build()
@@ -0,0 +1,79 @@
+import json
+import sqlite3
+import threading
+import time
+from telemetry import NULL_TELEMETRY
+
+
+class PersistentCache:
+    """ Persistent key-value store on SQLite for geocoding and routing results
+        Values are stored as JSON under a namespace (e.g. geocode, route) and a string key.
+        Entries older than ttl seconds are treated as missing and, once the store holds more than max_entries,
+        the least recently used entries are evicted.
+        Hits and misses are counted per namespace in telemetry
+    """
+    telemetry = NULL_TELEMETRY
+
+    def __init__(self, path='match_routing_cache.sqlite', ttl=90 * 24 * 60 * 60, max_entries=100000, telemetry=None):
+        self.path = path
+        if telemetry is not None:
+            self.telemetry = telemetry
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._connect()
+
+    def _connect(self):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, value TEXT, "
+                                "created REAL, accessed REAL, PRIMARY KEY (namespace, key))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def __getstate__(self):
+        return {'path': self.path, 'ttl': self.ttl, 'max_entries': self.max_entries}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._connect()
+
+    def get(self, namespace, key, default=None):
+        """ Return the value stored for key, or default if it is missing or expired
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT value, created FROM cache WHERE namespace = ? AND key = ?",
+                                          (namespace, key)).fetchone()
+            if row is None:
+                self.telemetry.count('cache misses ' + namespace)
+                return default
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self.connection.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+                self.telemetry.count('cache misses ' + namespace)
+                return default
+            self.connection.execute("UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?",
+                                    (now, namespace, key))
+        self.telemetry.count('cache hits ' + namespace)
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value):
+        """ Store a JSON serializable value and evict the least recently used entries above max_entries
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                                    (namespace, key, json.dumps(value), now, now))
+            if self.max_entries is not None:
+                self.connection.execute("DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache "
+                                        "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def clear(self):
+        """ Remove all entries
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM cache")
+
+
+def route_key(lat1, lon1, lat2, lon2, mode):
+    """ Cache key of a route between two coordinates
+    """
+    return "{0},{1},{2},{3},{4}".format(lat1, lon1, lat2, lon2, mode)
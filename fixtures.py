@@ -1,15 +1,42 @@
+import copy
+import json
+import numpy as np
 import pandas as pd
 from datetime import timedelta
-import requests
-import json
+from functools import cached_property
+from geopy.adapters import RequestsAdapter
 from geopy.geocoders import Nominatim
-from utils import time_calculator
+from cache import PersistentCache
+from fixturestore import FixtureStore
+from httpclient import HttpClient
+from telemetry import NULL_TELEMETRY
+from utils import geocode, geocode_batch, haversine_matrix, route_time_matrix, travel_time_row, TravelTimes
+
+FOOTBALL_URL = "https://api-football-v1.p.rapidapi.com/v3/fixtures"
+FOOTBALL_HOST = "api-football-v1.p.rapidapi.com"
+SUCCESSOR_BLOCK = 1 << 22
+""" Number of match pairs checked at once by _get_time_between_matches """
+SNAPSHOT_VERSION = 1
+""" Version of the snapshot format written by Fixtures._save_snapshot """
+FIXTURE_COLUMNS = ['date', 'home team', 'away team', 'match id', 'stadium name', 'stadium city', 'stadium lat',
+                   'stadium lon']
+TEAM_COLUMNS = ['Team', 'Lat', 'Lon', 'City', 'Stadium']
+ARC_INDEX = ['possible_successor', 'arcs', 'possible_predecessor', 'successor_set', 'arcs_by_team']
+""" Views of the successor graph keyed by match id, built from its CSR arrays on first use """
 
 
 class Fixtures:
     """ Class Fixtures, generate the list of matches and dates for a given league and season
+        Geocoding results are kept in a persistent cache at cache_path, pass cache_path=None to disable it
+        Travel times use Haversine Distance unless route_travel_times is set, then Route and directions API is used
+        geolocator is any geopy geocoder, by default Nominatim on a pooled requests session. Pass for instance
+        Nominatim(user_agent=..., domain='localhost:8080', scheme='http') to geocode against a local server.
+        telemetry (see telemetry.py) times the phases and counts HTTP calls, cache hits, matches and arcs. It is
+        shared with the cache, the default client and the solvers of these fixtures
     """
-    def __init__(self, foot_api_key, route_api_key, league_id, year, airport_origin, league_country, min_int_match):
+    def __init__(self, foot_api_key, route_api_key, league_id, year, airport_origin, league_country, min_int_match,
+                 cache_path='match_routing_cache.sqlite', route_travel_times=False, client=None, telemetry=None,
+                 geolocator=None):
         self.foot_api_key = foot_api_key
         self.route_api_key = route_api_key
         self.league_id = str(league_id)
@@ -17,66 +44,95 @@ class Fixtures:
         self.airport_origin = airport_origin
         self.min_int_match = min_int_match
         self.league_country = league_country
-        self.geolocator = Nominatim(user_agent="match routing")
+        self.geolocator = geolocator or Nominatim(user_agent="match routing", adapter_factory=RequestsAdapter)
+        self.telemetry = telemetry or NULL_TELEMETRY
+        self.cache = PersistentCache(cache_path, telemetry=telemetry) if cache_path is not None else None
+        self.route_travel_times = route_travel_times
+        self.client = client or HttpClient(telemetry=telemetry)
 
     def _get_fixtures(self):
         """ Pull all matches for the league from API Football and geocode each of the locations
+            Venues are geocoded concurrently, falling back to the city and then the country when not found
         """
-        url = "https://api-football-v1.p.rapidapi.com/v3/fixtures"
-        headers = {"X-RapidAPI-Key": self.foot_api_key, "X-RapidAPI-Host": "api-football-v1.p.rapidapi.com"}
+        headers = {"X-RapidAPI-Key": self.foot_api_key, "X-RapidAPI-Host": FOOTBALL_HOST}
         querystring = {"league": self.league_id, "season": self.year}
-        response = requests.request("GET", url, headers=headers, params=querystring)
-        all_responses = response.text
-        res = json.loads(all_responses)
+        with self.telemetry.span('football api'):
+            res = self.client.get_json(FOOTBALL_URL, params=querystring, headers=headers, provider='football')
 
-        geocode_result = self.geolocator.geocode(self.airport_origin, timeout=2)
-        self.airport_lat = geocode_result.latitude
-        self.airport_lon = geocode_result.longitude
-        self.matches_team = {}
+        with self.telemetry.span('geocoding'):
+            self.airport_lat, self.airport_lon = geocode(self.geolocator, self.airport_origin, self.cache,
+                                                         self.client)
 
+        venues = {}
+        for i in res.get('response', []):
+            stadium_name = i['fixture']['venue']['name'] + "," + i['fixture']['venue']['city']
+            venues[stadium_name] = i['fixture']['venue']['city'] + "," + self.league_country
+        fallbacks = [lambda name, city: name + "," + self.league_country,
+                     lambda name, city: city,
+                     lambda name, city: city.split(", ")[1]]
         teams_stadiums = {}
+        pending = list(venues)
+        with self.telemetry.span('geocoding'):
+            for query in fallbacks:
+                if not pending:
+                    break
+                locations = geocode_batch(self.geolocator, [query(name, venues[name]) for name in pending], self.cache,
+                                          self.client)
+                for name, location in zip(pending, locations):
+                    if location is not None:
+                        teams_stadiums[name] = location
+                pending = [name for name in pending if name not in teams_stadiums]
+
+        matches = []
+        for i in res.get('response', []):
+            stadium_name = i['fixture']['venue']['name'] + "," + i['fixture']['venue']['city']
+            matches.append({'date': pd.to_datetime(i['fixture']['date']),
+                            'home team': i["teams"]["home"]["name"],
+                            'away team': i["teams"]["away"]["name"],
+                            'stadium': stadium_name,
+                            'stadium name': i['fixture']['venue']['name'],
+                            'stadium city': venues[stadium_name],
+                            'stadium lat': teams_stadiums[stadium_name][0],
+                            'stadium lon': teams_stadiums[stadium_name][1]})
+        self._build_fixtures(matches)
+
+    def _build_fixtures(self, matches):
+        """ Build the fixtures and teams tables from a list of geocoded matches
+            Each match is a dict with keys date, home team, away team, stadium, stadium name, stadium city,
+            stadium lat and stadium lon. The airport coordinates must already be set.
+            A pair of teams meeting more than once at the same home ground, as in cup ties, gets ids "Home x Away",
+            "Home x Away (2)" and so on
+        """
+        self.matches_team = {}
+        legs = {}
         fixtures_dict = {'date': [], 'home team': [], 'away team': [], 'match id': [], 'stadium name': [],
                          'stadium city': [], 'stadium lat': [], 'stadium lon': []}
         teams_dict = {'Team': [], 'Lat': [], 'Lon': [], 'City': [], 'Stadium': []}
-        if 'response' in res:
-            for i in res['response']:
-                team_home = i["teams"]["home"]["name"]
-                team_away = i["teams"]["away"]["name"]
-                stadium_name = i['fixture']['venue']['name'] + "," + i['fixture']['venue']['city']
-                stadium_city = i['fixture']['venue']['city'] + "," + self.league_country
-                place_name = stadium_name + "," + self.league_country
-                if stadium_name in teams_stadiums:
-                    stadium_lat = teams_stadiums[stadium_name][0]
-                    stadium_lon = teams_stadiums[stadium_name][1]
-                    stadium_city = teams_stadiums[stadium_name][2]
-                else:
-                    geocode_result = self.geolocator.geocode(place_name, timeout=2)
-                    if geocode_result is None:
-                        geocode_result = self.geolocator.geocode(stadium_city, timeout=2)
-                        if geocode_result is None:
-                            geocode_result = self.geolocator.geocode(stadium_city.split(", ")[1], timeout=2)
-                    stadium_lat = geocode_result.latitude
-                    stadium_lon = geocode_result.longitude
-                    teams_stadiums[stadium_name] = (stadium_lat, stadium_lon, stadium_city)
-                match_id = team_home + " x " + team_away
-                fixtures_dict['date'].append(pd.to_datetime(i['fixture']['date']))
-                fixtures_dict['home team'].append(team_home)
-                fixtures_dict['away team'].append(team_away)
-                fixtures_dict['match id'].append(match_id)
-                fixtures_dict['stadium name'].append(i['fixture']['venue']['name'])
-                fixtures_dict['stadium city'].append(stadium_city)
-                fixtures_dict['stadium lat'].append(stadium_lat)
-                fixtures_dict['stadium lon'].append(stadium_lon)
-                if team_home in self.matches_team:
-                    self.matches_team[team_home].append(match_id)
-                else:
-                    self.matches_team[team_home] = [match_id]
-                if team_home not in teams_dict['Team']:
-                    teams_dict['Team'].append(team_home)
-                    teams_dict['Lat'].append(stadium_lat)
-                    teams_dict['Lon'].append(stadium_lon)
-                    teams_dict['City'].append(stadium_city)
-                    teams_dict['Stadium'].append(stadium_name)
+        for i in matches:
+            team_home = i['home team']
+            team_away = i['away team']
+            match_id = team_home + " x " + team_away
+            legs[match_id] = legs.get(match_id, 0) + 1
+            if legs[match_id] > 1:
+                match_id += " ({0})".format(legs[match_id])
+            fixtures_dict['date'].append(i['date'])
+            fixtures_dict['home team'].append(team_home)
+            fixtures_dict['away team'].append(team_away)
+            fixtures_dict['match id'].append(match_id)
+            fixtures_dict['stadium name'].append(i['stadium name'])
+            fixtures_dict['stadium city'].append(i['stadium city'])
+            fixtures_dict['stadium lat'].append(i['stadium lat'])
+            fixtures_dict['stadium lon'].append(i['stadium lon'])
+            if team_home in self.matches_team:
+                self.matches_team[team_home].append(match_id)
+            else:
+                self.matches_team[team_home] = [match_id]
+            if team_home not in teams_dict['Team']:
+                teams_dict['Team'].append(team_home)
+                teams_dict['Lat'].append(i['stadium lat'])
+                teams_dict['Lon'].append(i['stadium lon'])
+                teams_dict['City'].append(i['stadium city'])
+                teams_dict['Stadium'].append(i['stadium'])
         self.start_league = min(fixtures_dict['date'])
         self.end_league = max(fixtures_dict['date'])
         fixtures_dict['date'].append(self.start_league - timedelta(days=5))
@@ -105,44 +161,406 @@ class Fixtures:
 
     def _get_travel_times(self):
         """ Calculates travel times from a stadium to another
+            Locations are indexed by team_index (the origin airport is 0) and times are kept in travel_matrix,
+            travel_times gives dict access by (team, team) names
         """
-        self.travel_times = {}
+        self.team_index = {self.airport_origin: 0}
         for team in self.teams_id:
-            time_to_origin = time_calculator(self.teams_dict['Lat'][team], self.teams_dict['Lon'][team],
-                                             self.airport_lat, self.airport_lon)
-            time_from_origin = time_calculator(self.airport_lat, self.airport_lon,
-                                               self.teams_dict['Lat'][team], self.teams_dict['Lon'][team])
-            self.travel_times[(team, self.airport_origin)] = time_to_origin
-            self.travel_times[(self.airport_origin, team)] = time_from_origin
-
-            for team2 in self.teams_id:
-                time = time_calculator(self.teams_dict['Lat'][team], self.teams_dict['Lon'][team],
-                                       self.teams_dict['Lat'][team2], self.teams_dict['Lon'][team2])
-                self.travel_times[(team, team2)] = time
-        self.travel_times[(self.airport_origin, self.airport_origin)] = 0
+            self.team_index[team] = len(self.team_index)
+        lats = [self.airport_lat] + [self.teams_dict['Lat'][team] for team in self.teams_id]
+        lons = [self.airport_lon] + [self.teams_dict['Lon'][team] for team in self.teams_id]
+        if self.route_travel_times:
+            self.travel_matrix = route_time_matrix(lats, lons, self.route_api_key, self.cache, self.client)
+        else:
+            self.travel_matrix = haversine_matrix(lats, lons)
+        self.travel_times = TravelTimes(self.travel_matrix, self.team_index)
+
+    def _build_store(self):
+        """ Build the integer-indexed store of the fixtures table, after the travel times
+        """
+        self.store = FixtureStore(self.fixtures, self.team_index, self.start_league)
 
     def _get_time_between_matches(self):
         """ Define the list of successors of a match - if it happens after it
+            Successors are computed on the integer ids of the store as a NumPy mask over blocks of SUCCESSOR_BLOCK
+            pairs, and kept as CSR arrays (see _set_successors)
+        """
+        self._build_store()
+        rows = np.array([self.store.match_index[k] for k in self.matches_id], dtype=np.int64)
+        start_hours = self.store.start_hours[rows]
+        home = self.store.home[rows]
+        counts = np.zeros(len(self.store) + 1, dtype=np.int64)
+        targets = []
+        block = max(1, SUCCESSOR_BLOCK // max(len(rows), 1))
+        for first in range(0, len(rows), block):
+            tails = np.arange(first, min(first + block, len(rows)))
+            """ A match m2 is a possible successor of m1 if:
+                - starting time of m2 is after starting time of m1 plus travel time from m1 to m2 and
+                - difference of starting time of m2 and m1 is higher than min_int_match"""
+            mask = start_hours[tails, None] + np.maximum(self.travel_matrix[home[tails, None], home[None, :]],
+                                                         self.min_int_match) <= start_hours[None, :]
+            mask[np.arange(len(tails)), tails] = False
+            counts[rows[tails] + 1] = mask.sum(axis=1)
+            targets.append(rows[np.nonzero(mask)[1]])
+        offsets = np.cumsum(counts)
+        self.fixtures_dict['start hours'] = dict(zip(self.store.match_ids, self.store.start_hours.tolist()))
+        self._set_successors(offsets, np.concatenate(targets or [np.zeros(0, np.int64)]))
+
+    def _set_successors(self, offsets, targets):
+        """ Set the successor graph from CSR arrays over the store ids, the successors of match n are
+            targets[offsets[n]:offsets[n + 1]] and arc n goes from arc_tails[n] to arc_heads[n]
+            The arc index keyed by match id (possible_successor, arcs, possible_predecessor, successor_set and
+            arcs_by_team) is built from these arrays on first use
+        """
+        self.successor_offsets, self.successor_targets = offsets, targets
+        self.arc_tails = np.repeat(np.arange(len(self.store)), np.diff(offsets))
+        self.arc_heads = targets
+        for name in ARC_INDEX:
+            self.__dict__.pop(name, None)
+        self.telemetry.gauge('matches', len(self.matches_id))
+        self.telemetry.gauge('arcs', len(targets))
+
+    def _build_arc_index(self):
+        """ Set the successor graph from possible_successor, after it was changed
+        """
+        possible_successor = self.possible_successor
+        self._set_successors(*self.store.successor_arrays(possible_successor))
+        self.possible_successor = possible_successor
+
+    @cached_property
+    def possible_successor(self):
+        """ Successors of each match of matches_id
+        """
+        rows = [self.store.match_index[k] for k in self.matches_id]
+        return self.store.successor_lists(rows, self.successor_offsets, self.successor_targets)
+
+    @cached_property
+    def arcs(self):
+        """ List of (match, successor) pairs, in the order of arc_tails and arc_heads
+        """
+        match_ids = self.store.match_ids
+        return [(match_ids[n], match_ids[n2]) for n, n2 in zip(self.arc_tails.tolist(), self.arc_heads.tolist())]
+
+    @cached_property
+    def possible_predecessor(self):
+        """ Reverse adjacency, the matches a match can be reached from
+        """
+        possible_predecessor = {m: [] for m in self.matches_id}
+        for m1, m2 in self.arcs:
+            possible_predecessor[m2].append(m1)
+        return possible_predecessor
+
+    @cached_property
+    def successor_set(self):
+        """ Set lookups of possible_successor
+        """
+        return {m: set(successors) for m, successors in self.possible_successor.items()}
+
+    @cached_property
+    def arcs_by_team(self):
+        """ Arcs grouped by the home team of the head match
+        """
+        home_team = self.fixtures_dict['home team']
+        arcs_by_team = {team: [] for team in self.matches_team}
+        for arc in self.arcs:
+            arcs_by_team[home_team[arc[1]]].append(arc)
+        return arcs_by_team
+
+    def _prune_arcs(self, max_span=None):
+        """ Preprocessing between _pull_fixtures and model building, shrinking the successor graph
+            - arcs between two home matches of the same team are removed, constraint c6 never uses both
+            - from a match other than Start, only the arc to the earliest successor of each home team is kept.
+              A later home match of the same team has the same travel times and no more successors, so swapping it
+              for the earliest one never makes a trip longer
+            - with max_span, for instance the trip duration of a heuristic tour, arcs between matches more than
+              max_span hours apart are removed. It is only a valid bound because every backend of SOLVERS minimizes
+              the trip duration first
+            - matches left without inbound or outbound arcs are removed, with their constraints
+            Returns the number of variables (arcs), matches and constraints removed
+        """
+        start_hours = self.fixtures_dict['start hours']
+        home_team = self.fixtures_dict['home team']
+        n_arcs = len(self.arcs)
+        n_matches = len(self.matches_id)
+        possible_successor = {}
+        for k in self.matches_id:
+            successors = [k2 for k2 in self.possible_successor[k] if home_team[k2] != home_team[k]]
+            if k != 'Start':
+                if max_span is not None:
+                    successors = [k2 for k2 in successors
+                                  if k2 == 'End' or start_hours[k2] - start_hours[k] <= max_span]
+                earliest = {}
+                for k2 in successors:
+                    if home_team[k2] not in earliest or start_hours[k2] < start_hours[earliest[home_team[k2]]]:
+                        earliest[home_team[k2]] = k2
+                successors = [k2 for k2 in successors if earliest[home_team[k2]] == k2]
+            possible_successor[k] = successors
+
+        matches_id = list(self.matches_id)
+        while True:
+            reached = {k2 for k in matches_id for k2 in possible_successor[k]}
+            dead = {k for k in matches_id
+                    if k not in ('Start', 'End') and (not possible_successor[k] or k not in reached)}
+            if not dead:
+                break
+            matches_id = [k for k in matches_id if k not in dead]
+            possible_successor = {k: [k2 for k2 in possible_successor[k] if k2 not in dead] for k in matches_id}
+        self.matches_id = matches_id
+        self.matches_team = {team: [k for k in matches if k in possible_successor]
+                             for team, matches in self.matches_team.items()}
+        self.possible_successor = possible_successor
+        self._build_arc_index()
+
+        """ Each match has a flow conservation constraint (c3) and inbound and outbound limits (c4, c5) """
+        matches_removed = n_matches - len(self.matches_id)
+        self.pruning_report = {'variables removed': n_arcs - len(self.arcs),
+                               'matches removed': matches_removed,
+                               'constraints removed': 3 * matches_removed}
+        return self.pruning_report
+
+    def _view(self):
+        """ Shallow copy of the fixtures without the geolocator, cache, client and telemetry, so it can be sent to
+            another process. Updates rebind attributes instead of mutating them, so a view is not changed by later
+            updates
         """
-        self.possible_successor = {}
-        self.fixtures_dict['start hours'] = {}
+        view = copy.copy(self)
+        view.geolocator = view.cache = view.client = None
+        view.telemetry = NULL_TELEMETRY
+        return view
+
+    def _window(self, start, end):
+        """ Reduced view of the fixtures keeping Start, End and the matches kicking off between start and end hours
+        """
+        view = self._view()
+        start_hours = self.fixtures_dict['start hours']
+        view.matches_id = [k for k in self.matches_id if k in ('Start', 'End') or start <= start_hours[k] <= end]
+        keep = set(view.matches_id)
+        view.possible_successor = {k: [k2 for k2 in self.possible_successor[k] if k2 in keep] for k in view.matches_id}
+        view.matches_team = {team: [k for k in matches if k in keep] for team, matches in self.matches_team.items()}
+        view._build_arc_index()
+        return view
+
+    def _set_origin(self, airport_origin):
+        """ Move the start and end of the trip to another airport without pulling the fixtures again
+            Only the Start and End matches, the airport row and column of the travel matrix and the arcs leaving
+            Start or entering End are recomputed
+        """
+        old_origin = self.airport_origin
+        self.airport_origin = airport_origin
+        self.airport_lat, self.airport_lon = geocode(self.geolocator, airport_origin, self.cache, self.client)
+
+        self.fixtures_dict = {column: dict(values) for column, values in self.fixtures_dict.items()}
+        for k in ('Start', 'End'):
+            self.fixtures_dict['home team'][k] = airport_origin
+            self.fixtures_dict['away team'][k] = airport_origin
+            self.fixtures_dict['stadium lat'][k] = self.airport_lat
+            self.fixtures_dict['stadium lon'][k] = self.airport_lon
+        self.fixtures = self.fixtures.copy()
+        dummies = self.fixtures['match id'].isin(['Start', 'End'])
+        self.fixtures.loc[dummies, ['home team', 'away team']] = airport_origin
+        self.fixtures.loc[dummies, 'stadium lat'] = self.airport_lat
+        self.fixtures.loc[dummies, 'stadium lon'] = self.airport_lon
+        self.matches_team = {airport_origin if team == old_origin else team: matches
+                             for team, matches in self.matches_team.items()}
+
+        self.team_index = {airport_origin if team == old_origin else team: n for team, n in self.team_index.items()}
+        lats = [self.teams_dict['Lat'][team] for team in self.teams_id]
+        lons = [self.teams_dict['Lon'][team] for team in self.teams_id]
+        route_api_key = self.route_api_key if self.route_travel_times else None
+        self.travel_matrix = self.travel_matrix.copy()
+        self.travel_matrix[0, 1:], self.travel_matrix[1:, 0] = travel_time_row(
+            self.airport_lat, self.airport_lon, lats, lons, route_api_key, self.cache, self.client)
+        self.travel_times = TravelTimes(self.travel_matrix, self.team_index)
+        self._build_store()
+
+        self.possible_successor = {k: [k2 for k2 in successors if k2 != 'End']
+                                   for k, successors in self.possible_successor.items()}
         for m1 in self.matches_id:
-            self.possible_successor[m1] = []
-            t1 = self.fixtures_dict['home team'][m1]
-            s1 = (self.fixtures_dict['date'][m1] - self.start_league).total_seconds() / (60 * 60)
-            self.fixtures_dict['start hours'][m1] = s1
-            for m2 in self.matches_id:
-                t2 = self.fixtures_dict['home team'][m2]
-                s2 = (self.fixtures_dict['date'][m2] - self.start_league).total_seconds() / (60 * 60)
-                """ A match m2 is a possible successor of m1 if:
-                    - starting time of m2 is after starting time of m1 plus travel time from m1 to m2 and
-                    - difference of starting time of m2 and m1 is higher than min_int_match"""
-                if m1 != m2 and s1 + max(self.travel_times[(t1, t2)], self.min_int_match) <= s2:
-                    self.possible_successor[m1].append(m2)
+            if m1 == 'End':
+                continue
+            if m1 == 'Start':
+                self.possible_successor[m1] = [m2 for m2 in self.matches_id if self._is_successor(m1, m2)]
+            elif self._is_successor(m1, 'End'):
+                self.possible_successor[m1].append('End')
+        self._build_arc_index()
+
+    def _is_successor(self, m1, m2):
+        """ Whether m2 can be watched after m1, with the rule of _get_time_between_matches
+        """
+        if m1 == m2:
+            return False
+        start_hours = self.fixtures_dict['start hours']
+        home_team = self.fixtures_dict['home team']
+        return start_hours[m1] + max(self.travel_times[(home_team[m1], home_team[m2])],
+                                     self.min_int_match) <= start_hours[m2]
+
+    def _localize(self, date):
+        """ Timestamp of date, in the timezone of start_league when it has none
+        """
+        date = pd.Timestamp(date)
+        if date.tzinfo is None and self.start_league.tzinfo is not None:
+            return date.tz_localize(self.start_league.tzinfo)
+        if date.tzinfo is not None and self.start_league.tzinfo is None:
+            raise ValueError("Date {0} has a timezone but the fixtures dates have none".format(date))
+        return date
+
+    def _update_fixtures(self, changes):
+        """ Apply rescheduled dates or new venues and recompute the successors of the affected matches only
+            changes maps a match id to a dict of new values among date, stadium name, stadium city, stadium lat and
+            stadium lon. Dates without a timezone are taken in the timezone of start_league. Travel times are kept per
+            team, so new venue coordinates move the home ground of the team: they must be given with the same values
+            for every home match of the team, a one-off move of a single match raises a ValueError. Returns the lists
+            of arcs removed and added
+        """
+        changes = {match_id: dict(values) for match_id, values in changes.items()}
+        moved_teams = {}
+        for match_id, values in changes.items():
+            if 'date' in values:
+                values['date'] = self._localize(values['date'])
+            if 'stadium lat' in values or 'stadium lon' in values:
+                if match_id in ('Start', 'End'):
+                    raise ValueError("The venue of {0} is the origin airport, use _set_origin".format(match_id))
+                moved_teams[self.fixtures_dict['home team'][match_id]] = match_id
+        for team in moved_teams:
+            venues = {(changes.get(k, {}).get('stadium lat', self.fixtures_dict['stadium lat'][k]),
+                       changes.get(k, {}).get('stadium lon', self.fixtures_dict['stadium lon'][k]))
+                      for k, home_team in self.fixtures_dict['home team'].items() if home_team == team}
+            if len(venues) > 1:
+                raise ValueError("New venue coordinates of {0} must be given for all its home matches, travel times "
+                                 "are kept per home ground".format(team))
+
+        self.fixtures_dict = {column: dict(values) for column, values in self.fixtures_dict.items()}
+        self.fixtures = self.fixtures.copy()
+        affected = set(changes)
+        for match_id, values in changes.items():
+            row = self.fixtures['match id'] == match_id
+            for column, value in values.items():
+                if column == 'date':
+                    self.fixtures_dict['start hours'][match_id] = \
+                        (value - self.start_league).total_seconds() / (60 * 60)
+                self.fixtures_dict[column][match_id] = value
+                self.fixtures.loc[row, column] = value
+        self._build_store()
+
+        if moved_teams:
+            self.teams_dict = {column: dict(values) for column, values in self.teams_dict.items()}
+            self.teams = self.teams.copy()
+            self.travel_matrix = self.travel_matrix.copy()
+            locations = sorted(self.team_index, key=self.team_index.get)
+            route_api_key = self.route_api_key if self.route_travel_times else None
+            for team, match_id in moved_teams.items():
+                self.teams_dict['Lat'][team] = self.fixtures_dict['stadium lat'][match_id]
+                self.teams_dict['Lon'][team] = self.fixtures_dict['stadium lon'][match_id]
+                self.teams.loc[self.teams['Team'] == team, ['Lat', 'Lon']] = \
+                    self.teams_dict['Lat'][team], self.teams_dict['Lon'][team]
+                lats = [self.teams_dict['Lat'][t] if t in self.teams_dict['Lat'] else self.airport_lat
+                        for t in locations]
+                lons = [self.teams_dict['Lon'][t] if t in self.teams_dict['Lon'] else self.airport_lon
+                        for t in locations]
+                n = self.team_index[team]
+                self.travel_matrix[n, :], self.travel_matrix[:, n] = travel_time_row(
+                    lats[n], lons[n], lats, lons, route_api_key, self.cache, self.client)
+                self.travel_matrix[n, n] = 0
+                affected.update(self.matches_team[team])
+            self.travel_times = TravelTimes(self.travel_matrix, self.team_index)
+
+        old_arcs = set(self.arcs)
+        possible_successor = {}
+        affected_matches = [m for m in self.matches_id if m in affected]
+        for m1 in self.matches_id:
+            if m1 in affected:
+                possible_successor[m1] = [m2 for m2 in self.matches_id if self._is_successor(m1, m2)]
+            else:
+                possible_successor[m1] = [m2 for m2 in self.possible_successor[m1] if m2 not in affected] + \
+                                         [m2 for m2 in affected_matches if self._is_successor(m1, m2)]
+        self.possible_successor = possible_successor
+        self._build_arc_index()
+        new_arcs = set(self.arcs)
+        return [arc for arc in old_arcs if arc not in new_arcs], [arc for arc in self.arcs if arc not in old_arcs]
+
+    def _save_snapshot(self, path):
+        """ Save the fixtures to a versioned .npz snapshot that from_snapshot loads without any network call
+            It holds the fixtures and teams tables with their geocodes, the travel matrix and the successor arcs in
+            CSR form, so pruned or rescheduled fixtures are saved as they are. Columns are stored as plain arrays,
+            dates as ISO strings with their UTC offset
+        """
+        metadata = {'version': SNAPSHOT_VERSION, 'league_id': self.league_id, 'year': self.year,
+                    'airport_origin': self.airport_origin, 'league_country': self.league_country,
+                    'min_int_match': np.asarray(self.min_int_match).item(),
+                    'airport_lat': float(self.airport_lat), 'airport_lon': float(self.airport_lon),
+                    'route_travel_times': self.route_travel_times,
+                    'start_league': self.start_league.isoformat(), 'end_league': self.end_league.isoformat()}
+        arrays = {'fixtures_' + column.replace(' ', '_'): self.fixtures[column].to_numpy()
+                  for column in FIXTURE_COLUMNS if column != 'date'}
+        arrays['fixtures_date'] = np.array([date.isoformat() for date in self.fixtures['date']])
+        arrays.update({'teams_' + column: self.teams[column].to_numpy() for column in TEAM_COLUMNS})
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, metadata=np.array(json.dumps(metadata)),
+                                locations=np.array(sorted(self.team_index, key=self.team_index.get)),
+                                travel_matrix=self.travel_matrix, matches_id=np.array(list(self.matches_id)),
+                                successor_offsets=self.successor_offsets, successor_targets=self.successor_targets,
+                                **{key: values.astype(float if values.dtype.kind == 'f' else str)
+                                   for key, values in arrays.items()})
+
+    @classmethod
+    def from_snapshot(cls, path, foot_api_key=None, route_api_key=None, cache_path=None, client=None, telemetry=None,
+                      geolocator=None):
+        """ Fixtures ready to solve from a snapshot saved by _save_snapshot, without pulling or geocoding anything
+            The successors are loaded as CSR arrays, the arc index keyed by match id is only built when a solver
+            first uses it. The API keys, cache, client and geolocator are only used to change the origin or the venues
+            afterwards, or to plot the route maps
+        """
+        with np.load(path, allow_pickle=False) as snapshot:
+            metadata = json.loads(str(snapshot['metadata']))
+            if metadata['version'] != SNAPSHOT_VERSION:
+                raise ValueError("Snapshot {0} has version {1}, expected {2}".format(
+                    path, metadata['version'], SNAPSHOT_VERSION))
+            fix = cls(foot_api_key, route_api_key, metadata['league_id'], metadata['year'],
+                      metadata['airport_origin'], metadata['league_country'], metadata['min_int_match'],
+                      cache_path=cache_path, route_travel_times=metadata['route_travel_times'], client=client,
+                      telemetry=telemetry, geolocator=geolocator)
+            fix.airport_lat, fix.airport_lon = metadata['airport_lat'], metadata['airport_lon']
+            fix.start_league = pd.Timestamp(metadata['start_league'])
+            fix.end_league = pd.Timestamp(metadata['end_league'])
+
+            fixtures_dict = {column: snapshot['fixtures_' + column.replace(' ', '_')].tolist()
+                             for column in FIXTURE_COLUMNS}
+            fixtures_dict['date'] = [pd.Timestamp(date) for date in fixtures_dict['date']]
+            fix.fixtures = pd.DataFrame.from_dict(fixtures_dict)
+            fix.fixtures_dict = fix.fixtures.set_index('match id').to_dict()
+            fix.teams = pd.DataFrame.from_dict({column: snapshot['teams_' + column].tolist()
+                                                for column in TEAM_COLUMNS})
+            fix.teams_dict = fix.teams.set_index('Team').to_dict()
+            fix.teams_id = fix.teams['Team'].unique()
+            fix.matches_id = snapshot['matches_id'].tolist()
+            keep = set(fix.matches_id)
+            fix.matches_team = {team: [] for team in fix.teams_id}
+            fix.matches_team[fix.airport_origin] = []
+            for k, team in zip(fixtures_dict['match id'], fixtures_dict['home team']):
+                if k in keep:
+                    fix.matches_team[team].append(k)
+
+            fix.team_index = {team: n for n, team in enumerate(snapshot['locations'].tolist())}
+            fix.travel_matrix = snapshot['travel_matrix']
+            fix.travel_times = TravelTimes(fix.travel_matrix, fix.team_index)
+            fix._build_store()
+            fix.fixtures_dict['start hours'] = dict(zip(fix.store.match_ids, fix.store.start_hours.tolist()))
+            fix._set_successors(snapshot['successor_offsets'], snapshot['successor_targets'])
+        return fix
+
+    def _set_min_int_match(self, min_int_match):
+        """ Change the minimum number of hours between two matches and recompute the successors
+        """
+        self.min_int_match = min_int_match
+        self.fixtures_dict = dict(self.fixtures_dict)
+        self._get_time_between_matches()
 
     def _pull_fixtures(self):
         """ Executes all the routines of the class
         """
-        self._get_fixtures()
-        self._get_travel_times()
-        self._get_time_between_matches()
+        with self.telemetry.span('fixtures'):
+            self._get_fixtures()
+        with self.telemetry.span('travel times'):
+            self._get_travel_times()
+        with self.telemetry.span('successors'):
+            self._get_time_between_matches()
@@ -1,10 +1,9 @@
 import gurobipy as grb
-import pandas as pd
-from datetime import timedelta
-from utils import pull_directions_api, create_map
+from routingsolver import RoutingSolver
+from heuristicmodel import HeuristicModel
 
 
-class FixtureSchedulingModel:
+class FixtureSchedulingModel(RoutingSolver):
     """ Build the mixed integer programming for the match routing problem
         The Match Routing Problem can be stated as the following: given the set of matches (fixtures) of a league,
         build a trip schedule starting and ending at the same point, making sure to:
@@ -13,146 +12,247 @@ class FixtureSchedulingModel:
             - Respect minimum allowed time between two matches
         While minimizing the difference between the last watched and first match watched (objective 1) and
               minimizing the total travel time (objective 2)
+        With warm_start, the tour of HeuristicModel is given to Gurobi as MIP start
+        With telemetry enabled, the incumbent objective, bound and gap are sent to its sink as the search progresses,
+        with the name of the objective optimized by the current pass. The final gap of each pass is kept in pass_gaps
     """
-    def __init__(self, Fixtures):
+    def __init__(self, Fixtures, warm_start=True):
+        super().__init__(Fixtures)
         self.opt_model = grb.Model(name="MIP Model")
-        self.fixture = Fixtures
+        self.warm_start = warm_start
+        self.time_to_first_feasible = None
+        self.pass_gaps = {}
 
     def _define_variables(self):
         """ Define model variables
         """
         """ Binary variable: 1 if match k is visited right before k2. 0 otherwise """
         self.x = {(k, k2): self.opt_model.addVar(vtype=grb.GRB.BINARY, name="x_{0}_{1}".format(k, k2))
-                  for k in self.fixture.matches_id for k2 in self.fixture.possible_successor[k]}
+                  for k, k2 in self.fixture.arcs}
 
     def _define_constraints(self):
         """ Define model constraints
+            The terms of every constraint are read from the arc index of the fixtures: possible_successor,
+            possible_predecessor and arcs_by_team
         """
+        x = self.x
+        successors = self.fixture.possible_successor
+        predecessors = self.fixture.possible_predecessor
+        inbound = {k: [x[k1, k] for k1 in predecessors[k]] for k in self.fixture.matches_id}
+        outbound = {k: [x[k, k2] for k2 in successors[k]] for k in self.fixture.matches_id}
+        inbound_matches = {k: [x[k1, k] for k1 in predecessors[k] if k1 not in ('Start', 'End')]
+                           for k in self.fixture.matches_id}
+        outbound_matches = {k: [x[k, k2] for k2 in successors[k] if k2 not in ('Start', 'End')]
+                            for k in self.fixture.matches_id}
+        inbound_team = {i: [x[arc] for arc in self.fixture.arcs_by_team[i]] for i in self.fixture.teams_id}
+        matches = [k for k in self.fixture.matches_id if k not in ('Start', 'End')]
+
         """ Constraint 1 - the trip must start at a dummy match called Start """
-        c1 = self.opt_model.addConstr(
-            grb.quicksum(self.x['Start', k2] for k2 in self.fixture.possible_successor['Start']) == 1, name="c1")
+        self.c1 = self.opt_model.addConstr(grb.quicksum(outbound['Start']) == 1, name="c1")
 
         """ Constraint 2 - the trip must end at a dummy match called End """
-        c2 = self.opt_model.addConstr(grb.quicksum(self.x[k2, 'End'] for k2 in self.fixture.matches_id if
-                                                   k2 not in ('Start', 'End') and 'End' in
-                                                   self.fixture.possible_successor[k2]) == 1, name="c2")
+        self.c2 = self.opt_model.addConstr(grb.quicksum(inbound_matches['End']) == 1, name="c2")
 
         """ Constraint 3 - Flow conservation constraint - a trip consists on a sequence of matches """
-        c3 = {k: self.opt_model.addConstr(
-            grb.quicksum(self.x[k2, k] for k2 in self.fixture.matches_id if k in self.fixture.possible_successor[k2]) ==
-            grb.quicksum(self.x[k, k2] for k2 in self.fixture.possible_successor[k]),
-            name="c3_{0}".format(k))
-            for k in self.fixture.matches_id if k not in ('Start', 'End')}
+        self.c3 = {k: self.opt_model.addConstr(grb.quicksum(inbound[k]) == grb.quicksum(outbound[k]),
+                                               name="c3_{0}".format(k))
+                   for k in matches}
 
         """ Constraint 4 - No more than 1 outbound match from a match """
-        c4 = {k: self.opt_model.addConstr(
-            grb.quicksum(
-                self.x[k, k2] for k2 in self.fixture.possible_successor[k] if k2 not in ('Start', 'End')) <= 1,
-            name="c4_{0}".format(k))
-            for k in self.fixture.matches_id if k not in ('Start', 'End')}
+        self.c4 = {k: self.opt_model.addConstr(grb.quicksum(outbound_matches[k]) <= 1, name="c4_{0}".format(k))
+                   for k in matches}
 
         """ Constraint 5 - No more than 1 inbound to from a match """
-        c5 = {k2: self.opt_model.addConstr(
-            grb.quicksum(
-                self.x[k, k2] for k in self.fixture.matches_id if
-                k2 in self.fixture.possible_successor[k] and k not in ('Start', 'End')) <= 1, name="c5_{0}".format(k2))
-            for k2 in self.fixture.matches_id if k2 not in ('Start', 'End')}
+        self.c5 = {k2: self.opt_model.addConstr(grb.quicksum(inbound_matches[k2]) <= 1, name="c5_{0}".format(k2))
+                   for k2 in matches}
 
         """ Constraint 6 - All stadiums must be visited exactly once"""
-        c6 = {i: self.opt_model.addConstr(
-            grb.quicksum(self.x['Start', k2] for k2 in self.fixture.matches_team[i] if
-                         k2 in self.fixture.possible_successor['Start']) +
-            grb.quicksum(
-                self.x[k, k2] for k in self.fixture.matches_id for k2 in self.fixture.possible_successor[k] if
-                k2 in self.fixture.matches_team[i] and k != 'Start') == 1, name="c6_{0}".format(i))
-            for i in self.fixture.teams_id if i != self.fixture.airport_origin}
+        self.c6 = {i: self.opt_model.addConstr(grb.quicksum(inbound_team[i]) == 1, name="c6_{0}".format(i))
+                   for i in self.fixture.teams_id if i != self.fixture.airport_origin}
 
     def _define_objective_function(self):
         """ Define objective function
         """
         """ Objective function 1 - minimize difference between first and last match of the trip """
         self.objective_travel_duration = grb.quicksum(
-            self.fixture.fixtures_dict['start hours'][k] * self.x[k, 'End'] for k in self.fixture.matches_id if
-            'End' in self.fixture.possible_successor[k]) - grb.quicksum(
+            self.fixture.fixtures_dict['start hours'][k] * self.x[k, 'End'] for k in
+            self.fixture.possible_predecessor['End']) - grb.quicksum(
             self.fixture.fixtures_dict['start hours'][k2] * self.x['Start', k2] for k2 in
             self.fixture.possible_successor['Start'])
 
         """ Objective function 2 - minimize total travel time """
-        self.objective_travel_time = grb.quicksum(
-            self.fixture.travel_times[
-                (self.fixture.fixtures_dict['home team'][k], self.fixture.fixtures_dict['home team'][k2])] *
-            self.x[k, k2] for k in self.fixture.matches_id for k2 in self.fixture.possible_successor[k])
+        home = self.fixture.store.home
+        travel = self.fixture.travel_matrix[home[self.fixture.arc_tails], home[self.fixture.arc_heads]]
+        self.objective_travel_time = grb.LinExpr(travel.tolist(), [self.x[arc] for arc in self.fixture.arcs])
 
     def _set_objective_function(self):
         """ Set objective function - minimization
         """
         objs = [self.objective_travel_duration, self.objective_travel_time]
-        priorities = [1, 2]  # higher priority, higher importance
+        """ Trip duration first and travel time second, the lexicographic order of the other backends """
+        priorities = [2, 1]  # higher priority, higher importance
         names = ['travel_duration', 'travel_time']
-        reltols = [0.2, 0.1]  # relative tolerance of each objective
+        reltols = [0, 0.1]  # relative tolerance of each objective
         weights = [1, 1]  # 1 is for minimization and -1 for maximization
         self.opt_model.ModelSense = grb.GRB.MINIMIZE
         for i, (obj, p, n, rel, w) in enumerate(zip(objs, priorities, names, reltols, weights)):
             self.opt_model.setObjectiveN(obj, index=i, priority=p, reltol=rel, name=n, weight=w)
+        """ Gurobi optimizes one objective per pass, by decreasing priority """
+        self.objective_passes = [n for _, n in sorted(zip(priorities, names), reverse=True)]
+
+    def _heuristic_tour(self):
+        """ Tour built by the construction heuristic, or None if it found none
+        """
+        heuristic = HeuristicModel(self.fixture)
+        heuristic._solve_model()
+        return heuristic.tour
+
+    def _set_warm_start(self):
+        """ Set the Start attribute of the x variables to the tour built by the construction heuristic
+        """
+        tour = self._heuristic_tour()
+        if tour is None:
+            return
+        arcs = set(zip(tour, tour[1:]))
+        for arc, var in self.x.items():
+            var.Start = 1 if arc in arcs else 0
+
+    def _record_first_feasible(self, model, where):
+        """ Gurobi callback keeping the runtime at which the first feasible solution was found
+        """
+        if where == grb.GRB.Callback.MIPSOL and self.time_to_first_feasible is None:
+            self.time_to_first_feasible = model.cbGet(grb.GRB.Callback.RUNTIME)
+
+    @staticmethod
+    def _gap(incumbent, bound):
+        """ Relative gap between an incumbent and a bound read in a callback, None while either is missing
+        """
+        incumbent = incumbent if abs(incumbent) < grb.GRB.INFINITY else None
+        bound = bound if abs(bound) < grb.GRB.INFINITY else None
+        gap = abs(incumbent - bound) / max(abs(incumbent), 1e-10) if None not in (incumbent, bound) else None
+        return incumbent, bound, gap
+
+    def _record_pass(self, model, where):
+        """ Gurobi callback run at the end of each pass of the multi-objective search
+            Keeps the gap of the objective of the pass in pass_gaps and counts the passes in objective_pass
+        """
+        if where != grb.GRB.Callback.MULTIOBJ:
+            return
+        objective = self.objective_passes[min(self.objective_pass, len(self.objective_passes) - 1)]
+        incumbent, bound, gap = self._gap(model.cbGet(grb.GRB.Callback.MULTIOBJ_OBJBST),
+                                          model.cbGet(grb.GRB.Callback.MULTIOBJ_OBJBND))
+        self.pass_gaps[objective] = gap
+        self.objective_pass = model.cbGet(grb.GRB.Callback.MULTIOBJ_OBJCNT)
+        self.telemetry.emit({'event': 'pass', 'solver': type(self).__name__, 'objective': objective,
+                             'runtime': model.cbGet(grb.GRB.Callback.RUNTIME), 'incumbent': incumbent,
+                             'bound': bound, 'gap': gap})
+
+    def _record_progress(self, model, where):
+        """ Gurobi callback sending the incumbent objective, bound and gap to the telemetry sink
+            On every new solution, and otherwise at most every telemetry.progress_interval seconds. Each record names
+            the objective of the current pass, counted by _record_pass
+        """
+        if where == grb.GRB.Callback.MIPSOL:
+            runtime = model.cbGet(grb.GRB.Callback.RUNTIME)
+            incumbent = min(model.cbGet(grb.GRB.Callback.MIPSOL_OBJ), model.cbGet(grb.GRB.Callback.MIPSOL_OBJBST))
+            bound = model.cbGet(grb.GRB.Callback.MIPSOL_OBJBND)
+        elif where == grb.GRB.Callback.MIP:
+            runtime = model.cbGet(grb.GRB.Callback.RUNTIME)
+            if runtime - self.last_progress < self.telemetry.progress_interval:
+                return
+            incumbent = model.cbGet(grb.GRB.Callback.MIP_OBJBST)
+            bound = model.cbGet(grb.GRB.Callback.MIP_OBJBND)
+        else:
+            return
+        self.last_progress = runtime
+        incumbent, bound, gap = self._gap(incumbent, bound)
+        objective = self.objective_passes[min(self.objective_pass, len(self.objective_passes) - 1)]
+        self.telemetry.emit({'event': 'progress', 'solver': type(self).__name__, 'objective': objective,
+                             'runtime': runtime, 'incumbent': incumbent, 'bound': bound, 'gap': gap})
+
+    def _callback(self, model, where):
+        """ Gurobi callback of _optimize
+        """
+        self._record_first_feasible(model, where)
+        self._record_pass(model, where)
+        if self.telemetry.enabled:
+            self._record_progress(model, where)
 
     def _solve_model(self):
         """ Call routine classes
         """
-        self._define_variables()
-        self._define_constraints()
+        with self.telemetry.span('variables'):
+            self._define_variables()
+        with self.telemetry.span('constraints'):
+            self._define_constraints()
+        with self.telemetry.span('objective'):
+            self._define_objective_function()
+            self._set_objective_function()
+        if self.warm_start:
+            with self.telemetry.span('warm start'):
+                self._set_warm_start()
+        self._optimize()
+
+    def _optimize(self):
+        """ Optimize the model and read the tour of the solution
+        """
+        self.time_to_first_feasible = None
+        self.last_progress = float('-inf')
+        self.objective_pass = 0
+        self.pass_gaps = {}
+        with self.telemetry.span('optimize'):
+            self.opt_model.optimize(self._callback)
+        self.telemetry.gauge('variables', self.opt_model.NumVars)
+        self.telemetry.gauge('constraints', self.opt_model.NumConstrs)
+        self.tour = self._extract_tour() if self.opt_model.SolCount > 0 else None
+
+    def _add_arc_variable(self, k, k2):
+        """ Add the variable of a new arc to the existing constraints
+        """
+        terms = []
+        if k == 'Start':
+            terms.append((1, self.c1))
+        if k2 == 'End' and k != 'Start':
+            terms.append((1, self.c2))
+        if k2 in self.c3:
+            terms.append((1, self.c3[k2]))
+        if k in self.c3:
+            terms.append((-1, self.c3[k]))
+        if k in self.c4 and k2 not in ('Start', 'End'):
+            terms.append((1, self.c4[k]))
+        if k2 in self.c5 and k not in ('Start', 'End'):
+            terms.append((1, self.c5[k2]))
+        team = self.fixture.fixtures_dict['home team'][k2]
+        if team in self.c6:
+            terms.append((1, self.c6[team]))
+        self.x[k, k2] = self.opt_model.addVar(vtype=grb.GRB.BINARY, name="x_{0}_{1}".format(k, k2),
+                                              column=grb.Column([c for c, _ in terms], [con for _, con in terms]))
+
+    def _update_model(self, changes):
+        """ Re-solve after matches are rescheduled, without rebuilding the model
+            changes is passed to Fixtures._update_fixtures. Only the variables of the arcs removed or added are
+            changed in opt_model, the objectives are rebuilt for the new kick-off times and the arcs of the previous
+            tour that still exist are given as a partial MIP start
+        """
+        removed, added = self.fixture._update_fixtures(changes)
+        for arc in removed:
+            self.opt_model.remove(self.x.pop(arc))
+        for k, k2 in added:
+            self._add_arc_variable(k, k2)
         self._define_objective_function()
         self._set_objective_function()
-        self.opt_model.optimize()
-
-    def _get_outputs(self):
-        """ Sort matches chosen by mathematical model by date
-        """
-        schedule_dict = {'Match': [], 'Stadium Name': [], 'Stadium City': [], 'Stadium Lat' : [], 'Stadium Lon': [],
-                         'Home Team': [], 'Away Team': [], 'Match Date': []}
-        for k in self.fixture.matches_id:
-            for k2 in self.fixture.possible_successor[k]:
-                if self.x[k, k2].X > 0.1:
-                    if k != 'Start':
-                        schedule_dict['Match'].append(k)
-                        schedule_dict['Home Team'].append(self.fixture.fixtures_dict['home team'][k])
-                        schedule_dict['Away Team'].append(self.fixture.fixtures_dict['away team'][k])
-                        schedule_dict['Stadium Name'].append(self.fixture.fixtures_dict['stadium name'][k])
-                        schedule_dict['Stadium City'].append(self.fixture.fixtures_dict['stadium city'][k])
-                        schedule_dict['Stadium Lat'].append(self.fixture.fixtures_dict['stadium lat'][k])
-                        schedule_dict['Stadium Lon'].append(self.fixture.fixtures_dict['stadium lon'][k])
-                        schedule_dict['Match Date'].append(
-                            self.fixture.fixtures_dict['date'][k].strftime('%Y-%m-%d %H:%M'))
-                        if k2 == 'End':
-                            schedule_dict['Match'].append(k2)
-                            schedule_dict['Home Team'].append(self.fixture.fixtures_dict['home team'][k2])
-                            schedule_dict['Away Team'].append(self.fixture.fixtures_dict['away team'][k2])
-                            schedule_dict['Stadium Name'].append(self.fixture.fixtures_dict['stadium name'][k2])
-                            schedule_dict['Stadium City'].append(self.fixture.fixtures_dict['stadium city'][k2])
-                            schedule_dict['Stadium Lat'].append(self.fixture.fixtures_dict['stadium lat'][k2])
-                            schedule_dict['Stadium Lon'].append(self.fixture.fixtures_dict['stadium lon'][k2])
-                            schedule_dict['Match Date'].append(
-                                (self.fixture.fixtures_dict['date'][k] + timedelta(days=1)).strftime('%Y-%m-%d %H:%M'))
-                    else:
-                        first_match = k2
-        schedule_dict['Match'].append('Start')
-        schedule_dict['Home Team'].append(self.fixture.fixtures_dict['home team']['Start'])
-        schedule_dict['Away Team'].append(self.fixture.fixtures_dict['away team']['Start'])
-        schedule_dict['Stadium Name'].append(self.fixture.fixtures_dict['stadium name']['Start'])
-        schedule_dict['Stadium City'].append(self.fixture.fixtures_dict['stadium city']['Start'])
-        schedule_dict['Stadium Lat'].append(self.fixture.fixtures_dict['stadium lat']['Start'])
-        schedule_dict['Stadium Lon'].append(self.fixture.fixtures_dict['stadium lon']['Start'])
-        schedule_dict['Match Date'].append(
-            (self.fixture.fixtures_dict['date'][first_match] - timedelta(days=1)).strftime('%Y-%m-%d %H:%M'))
-        self.output_schedule = pd.DataFrame.from_dict(schedule_dict)
-        self.output_schedule = self.output_schedule.sort_values(by='Match Date', ascending=True)
-        self.output_schedule.to_csv("Output Schedule.csv", index=False)
-
-    def _plot_maps(self):
-        responses = []
-        lat_lons = list(zip(self.output_schedule['Stadium Lat'], self.output_schedule['Stadium Lon']))
-        for n in range(len(lat_lons) - 1):
-            lat1, lon1, lat2, lon2 = lat_lons[n][0], lat_lons[n][1], lat_lons[n + 1][0], lat_lons[n + 1][1]
-            response = pull_directions_api(lat1, lon1, lat2, lon2, self.fixture.route_api_key)
-            responses.append(response)
-        m = create_map(responses, lat_lons)
-        m.save('./route_map.html')
\ No newline at end of file
+        if self.tour is not None:
+            arcs = set(zip(self.tour, self.tour[1:]))
+            self.opt_model.setAttr('Start', list(self.x.values()),
+                                   [1 if arc in arcs else grb.GRB.UNDEFINED for arc in self.x])
+        self._optimize()
+        return removed, added
+
+    def _extract_tour(self):
+        """ Follow the arcs chosen by the mathematical model from Start to End
+        """
+        next_match = {k: k2 for (k, k2), var in self.x.items() if var.X > 0.1}
+        tour = ['Start']
+        while tour[-1] != 'End':
+            tour.append(next_match[tour[-1]])
+        return tour
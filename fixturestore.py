@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+
+class FixtureStore:
+    """ Columnar copy of the fixtures table with integer match and team ids
+        Match n is row n of Fixtures.fixtures. Team n is location n of the travel matrix (0 is the origin airport),
+        teams that only play away follow them. Match and team names are only used at the API boundary, through
+        match_ids/match_index and team_names/team_index. The store is never changed once built, Fixtures builds a new
+        one when the table changes
+    """
+    def __init__(self, fixtures, team_index, start_league):
+        self.match_ids = fixtures['match id'].tolist()
+        self.match_index = {k: n for n, k in enumerate(self.match_ids)}
+        self.team_names = sorted(team_index, key=team_index.get)
+        self.team_index = dict(team_index)
+        for team in fixtures['away team']:
+            if team not in self.team_index:
+                self.team_index[team] = len(self.team_names)
+                self.team_names.append(team)
+
+        self.home = np.array([self.team_index[team] for team in fixtures['home team']], dtype=np.int64)
+        self.away = np.array([self.team_index[team] for team in fixtures['away team']], dtype=np.int64)
+        self.lat = fixtures['stadium lat'].to_numpy(dtype=float)
+        self.lon = fixtures['stadium lon'].to_numpy(dtype=float)
+        self.stadium_name = fixtures['stadium name'].to_numpy(dtype=object)
+        self.stadium_city = fixtures['stadium city'].to_numpy(dtype=object)
+        """ Dates keep the UTC offset of the venue for outputs, start hours are counted from start_league in UTC """
+        self.dates = fixtures['date'].to_numpy(dtype=object)
+        elapsed = pd.to_datetime(fixtures['date'], utc=True) - pd.to_datetime(start_league, utc=True)
+        self.start_hours = elapsed.dt.total_seconds().to_numpy() / (60 * 60)
+
+    def __len__(self):
+        return len(self.match_ids)
+
+    def successor_arrays(self, possible_successor):
+        """ CSR form of a dict of successor lists keyed by match id
+            The successors of match n are targets[offsets[n]:offsets[n + 1]], matches missing from the dict have
+            none. Arcs are ordered by tail and then by their position in the lists
+        """
+        counts = np.zeros(len(self.match_ids) + 1, dtype=np.int64)
+        for k, successors in possible_successor.items():
+            counts[self.match_index[k] + 1] = len(successors)
+        offsets = np.cumsum(counts)
+        targets = np.empty(offsets[-1], dtype=np.int64)
+        for k, successors in possible_successor.items():
+            n = self.match_index[k]
+            targets[offsets[n]:offsets[n + 1]] = [self.match_index[k2] for k2 in successors]
+        return offsets, targets
+
+    def successor_lists(self, rows, offsets, targets):
+        """ Dict of successor lists keyed by match id for the matches of rows, from CSR arrays
+        """
+        match_ids = self.match_ids
+        return {match_ids[n]: [match_ids[n2] for n2 in targets[offsets[n]:offsets[n + 1]].tolist()] for n in rows}
@@ -0,0 +1,106 @@
+from bisect import bisect_left, bisect_right
+from routingsolver import RoutingSolver
+
+
+class HeuristicModel(RoutingSolver):
+    """ Construction heuristic for the match routing problem
+        A beam search walks the fixtures in kick-off order from Start, adding one match of an unvisited team at a
+        time and keeping the beam_width most promising partial trips, ranked by a lower bound on the trip duration
+        and then by travel time. Each partial trip only branches to the next branching home matches of every
+        unvisited team. The tour found is then repaired by local search, moving the match of a team to another
+        home match of the same team while it shortens the trip duration or, failing that, the travel time.
+        The tour is feasible but not guaranteed optimal; FixtureSchedulingModel uses it as a MIP start
+    """
+    def __init__(self, Fixtures, beam_width=50, branching=2):
+        super().__init__(Fixtures)
+        self.beam_width = beam_width
+        self.branching = branching
+
+    def _beam_search(self):
+        """ Build a feasible tour from Start to End, or return None if the beam lost every feasible trip
+        """
+        start_hours = self.fixture.fixtures_dict['start hours']
+        home_team = self.fixture.fixtures_dict['home team']
+        travel_times = self.fixture.travel_times
+
+        """ A label is (first match kick-off, travel time, match, previous label, visited-teams mask) """
+        root = (None, 0.0, 'Start', None, 0)
+        beam = [root]
+        for _ in range(len(self.team_bit)):
+            candidates = {}
+            for label in beam:
+                first, travel, k, _, mask = label
+                start = start_hours[k] if k != 'Start' else float('-inf')
+                for team, bit in self.team_bit.items():
+                    if mask & bit:
+                        continue
+                    matches = self.home_matches[team]
+                    added = 0
+                    for n in range(bisect_right(self.home_starts[team], start), len(matches)):
+                        k2 = matches[n]
+                        if k2 not in self.fixture.successor_set[k]:
+                            continue
+                        added += 1
+                        last_start = self._last_start_bound(start_hours[k2], mask | bit)
+                        if last_start is not None:
+                            first2 = start_hours[k2] if first is None else first
+                            label2 = (first2, travel + travel_times[(home_team[k], team)], k2, label, mask | bit)
+                            score = (last_start - first2, label2[1])
+                            if (k2, mask | bit) not in candidates or score < candidates[k2, mask | bit][0]:
+                                candidates[k2, mask | bit] = (score, label2)
+                        if added == self.branching:
+                            break
+            beam = [label for _, label in sorted(candidates.values(), key=lambda c: c[0])[:self.beam_width]]
+
+        complete = [label for label in beam if 'End' in self.fixture.successor_set[label[2]]]
+        if not complete:
+            return None
+        best = min(complete, key=lambda label: (start_hours[label[2]] - label[0], label[1] + travel_times[
+            (home_team[label[2]], home_team['End'])]))
+        tour = ['End']
+        while best is not None:
+            tour.append(best[2])
+            best = best[3]
+        return tour[::-1]
+
+    def _improve_tour(self, tour):
+        """ Local search repair: move the match of a team to another of its home matches, inserted in kick-off
+            order, as long as the lexicographic (trip duration, travel time) objective improves
+        """
+        start_hours = self.fixture.fixtures_dict['start hours']
+        home_team = self.fixture.fixtures_dict['home team']
+        successor_set = self.fixture.successor_set
+        objectives = self._tour_objectives(tour)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1, len(tour) - 1):
+                if tour[i + 1] not in successor_set[tour[i - 1]]:
+                    continue
+                rest = tour[:i] + tour[i + 1:]
+                rest_starts = [start_hours[k] for k in rest[1:-1]]
+                for k2 in self.home_matches[home_team[tour[i]]]:
+                    if k2 == tour[i]:
+                        continue
+                    j = bisect_left(rest_starts, start_hours[k2]) + 1
+                    if k2 not in successor_set[rest[j - 1]] or rest[j] not in successor_set[k2]:
+                        continue
+                    candidate = rest[:j] + [k2] + rest[j:]
+                    candidate_objectives = self._tour_objectives(candidate)
+                    if candidate_objectives < objectives:
+                        tour, objectives, improved = candidate, candidate_objectives, True
+                        break
+                if improved:
+                    break
+        return tour
+
+    def _solve_model(self):
+        """ Build a tour with the beam search and repair it with local search
+        """
+        self._index_teams()
+        with self.telemetry.span('beam search'):
+            tour = self._beam_search()
+        if tour is not None:
+            with self.telemetry.span('local search'):
+                self.tour = self._improve_tour(tour)
+            self.objective_travel_duration, self.objective_travel_time = self._tour_objectives()
@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from telemetry import NULL_TELEMETRY
+
+PROVIDERS = {
+    'football': {'concurrency': 4, 'rate': 5},
+    'route': {'concurrency': 8, 'rate': 10},
+    'nominatim': {'concurrency': 1, 'rate': 1},
+    'default': {'concurrency': 8, 'rate': None},
+}
+""" Concurrency (simultaneous requests) and rate (requests per second, None for no limit) of each provider
+    Nominatim usage policy allows at most 1 request per second
+"""
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+""" HTTP status codes that are retried """
+
+
+class RateLimiter:
+    """ Token bucket allowing rate calls per second, shared by all threads
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Block until a call is allowed
+        """
+        if self.rate is None:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpClient:
+    """ HTTP client with a pooled session, per provider concurrency and rate limits and retries with exponential
+        backoff on connection errors and on the status codes in RETRY_STATUS
+        Calls and retries are counted per provider in telemetry
+    """
+    telemetry = NULL_TELEMETRY
+
+    def __init__(self, providers=None, retries=3, backoff=0.5, timeout=30, pool_size=16, telemetry=None):
+        self.providers = dict(PROVIDERS, **(providers or {}))
+        if telemetry is not None:
+            self.telemetry = telemetry
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._setup()
+
+    def _setup(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.semaphores = {name: threading.BoundedSemaphore(p['concurrency']) for name, p in self.providers.items()}
+        self.limiters = {name: RateLimiter(p['rate']) for name, p in self.providers.items()}
+
+    def __getstate__(self):
+        return {'providers': self.providers, 'retries': self.retries, 'backoff': self.backoff,
+                'timeout': self.timeout, 'pool_size': self.pool_size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
+    def call(self, provider, fn, *args, retry_on=(requests.ConnectionError, requests.Timeout), **kwargs):
+        """ Call fn within the concurrency and rate limits of provider, retrying on the retry_on exceptions
+        """
+        for attempt in range(self.retries + 1):
+            with self.semaphores[provider]:
+                self.limiters[provider].acquire()
+                self.telemetry.count('http calls ' + provider)
+                try:
+                    return fn(*args, **kwargs)
+                except retry_on:
+                    if attempt == self.retries:
+                        raise
+            self.telemetry.count('http retries ' + provider)
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def get_json(self, url, params=None, headers=None, provider='default'):
+        """ GET url and return the decoded JSON body
+            Raises requests.HTTPError on an error status that is not retried or is still returned after the retries
+        """
+        for attempt in range(self.retries + 1):
+            response = self.call(provider, self.session.get, url, params=params, headers=headers,
+                                 timeout=self.timeout)
+            if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                response.raise_for_status()
+                return response.json()
+            self.telemetry.count('http retries ' + provider)
+            retry_after = response.headers.get('Retry-After', '')
+            time.sleep(float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt)
+
+    def map(self, fn, items, max_workers=None):
+        """ Apply fn to every item concurrently and return the results in the order of items
+        """
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=max_workers or self.pool_size) as executor:
+            return list(executor.map(fn, items))
+
+    def map_unordered(self, fn, items, max_workers=None):
+        """ Apply fn to every item concurrently and yield the results as they complete
+        """
+        items = list(items)
+        if len(items) <= 1:
+            yield from (fn(item) for item in items)
+            return
+        with ThreadPoolExecutor(max_workers=max_workers or self.pool_size) as executor:
+            for future in as_completed([executor.submit(fn, item) for item in items]):
+                yield future.result()
+
+
+_default_client = None
+
+
+def default_client():
+    """ Client shared by the calls that are not given one
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = HttpClient()
+    return _default_client
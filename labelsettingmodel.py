@@ -0,0 +1,115 @@
+from routingsolver import RoutingSolver
+from heuristicmodel import HeuristicModel
+
+
+class LabelSettingModel(RoutingSolver):
+    """ Exact label-setting solver for the match routing problem, no Gurobi license needed
+        Successors only link a match to later matches, so the arc graph is acyclic in time and the problem is a
+        resource-constrained shortest path from Start to End visiting the home ground of every team once.
+        Matches are processed in kick-off order. A label at a match holds the set of visited teams as a bitmask,
+        the kick-off of the first match watched and the travel time so far. Among labels with the same
+        (last match, visited-teams set), a label with a later first match and a shorter travel time dominates.
+        Labels whose trip duration is already known to exceed the best complete trip are pruned.
+        The objective is lexicographic: trip duration (objective 1) and then total travel time (objective 2).
+    """
+    def __init__(self, Fixtures):
+        super().__init__(Fixtures)
+        self.labels_created = 0
+        self.searches = 0
+
+    def _add_label(self, labels, k, mask, label):
+        """ Keep label at (k, mask) unless it is dominated, dropping the labels it dominates
+        """
+        first, travel = label[0], label[1]
+        bucket = labels.setdefault(k, {}).setdefault(mask, [])
+        for other in bucket:
+            if other[0] >= first and other[1] <= travel:
+                return
+        bucket[:] = [other for other in bucket if not (first >= other[0] and travel <= other[1])]
+        bucket.append(label)
+        self.labels_created += 1
+
+    def _search(self, max_duration):
+        """ Extend labels along the arcs in kick-off order and keep the best complete trip
+            Labels that cannot finish within max_duration hours are pruned. Returns the best label and its
+            objectives, and the smallest trip duration bound that was pruned
+        """
+        start_hours = self.fixture.fixtures_dict['start hours']
+        home_team = self.fixture.fixtures_dict['home team']
+        travel_times = self.fixture.travel_times
+        best = None
+        best_objectives = (max_duration, float('inf'))
+        next_duration = float('inf')
+
+        """ A label is (first match kick-off, travel time, match, previous label) """
+        labels = {}
+        root = (None, 0.0, 'Start', None)
+        for k2 in self.fixture.possible_successor['Start']:
+            bit = self.team_bit.get(home_team[k2])
+            if bit is None:
+                continue
+            last_start = self._last_start_bound(start_hours[k2], bit)
+            if last_start is None:
+                continue
+            if last_start - start_hours[k2] > max_duration:
+                next_duration = min(next_duration, last_start - start_hours[k2])
+                continue
+            travel = travel_times[(home_team['Start'], home_team[k2])]
+            self._add_label(labels, k2, bit, (start_hours[k2], travel, k2, root))
+
+        for k in self.order:
+            for mask, bucket in labels.pop(k, {}).items():
+                if mask == self.full_mask:
+                    if 'End' in self.fixture.successor_set[k]:
+                        for label in bucket:
+                            objectives = (start_hours[k] - label[0],
+                                          label[1] + travel_times[(home_team[k], home_team['End'])])
+                            if objectives <= best_objectives:
+                                best, best_objectives = label, objectives
+                    continue
+                for k2 in self.fixture.possible_successor[k]:
+                    bit = self.team_bit.get(home_team[k2])
+                    if bit is None or mask & bit:
+                        continue
+                    last_start = self._last_start_bound(start_hours[k2], mask | bit)
+                    if last_start is None:
+                        continue
+                    arc_time = travel_times[(home_team[k], home_team[k2])]
+                    for label in bucket:
+                        objectives = (last_start - label[0], label[1] + arc_time)
+                        if objectives[0] > max_duration:
+                            next_duration = min(next_duration, objectives[0])
+                        elif objectives <= best_objectives:
+                            self._add_label(labels, k2, mask | bit, (label[0], objectives[1], k2, label))
+        return best, best_objectives, next_duration
+
+    def _solve_model(self):
+        """ Search with an increasing cap on the trip duration, starting from its lower bound
+            Every search is exact for trips within its cap, so the first one to find a trip gives the optimum.
+            The cap grows by at least a step that starts at a day and doubles after every search, and never exceeds the
+            trip duration of the HeuristicModel tour, so a search with that cap always finds a trip
+        """
+        self._index_teams()
+        heuristic = HeuristicModel(self.fixture)
+        with self.telemetry.span('heuristic'):
+            heuristic._solve_model()
+        max_heuristic = heuristic.objective_travel_duration if heuristic.tour is not None else float('inf')
+        best, max_duration, step = None, 0.0, 24.0
+        while best is None and max_duration < float('inf'):
+            with self.telemetry.span('label search'):
+                best, objectives, next_duration = self._search(max_duration)
+            self.searches += 1
+            if max_duration >= max_heuristic:
+                break
+            max_duration = min(max(next_duration, max_duration + step), max_heuristic)
+            step *= 2
+        self.telemetry.gauge('labels created', self.labels_created)
+        self.telemetry.gauge('label searches', self.searches)
+        if best is not None:
+            self.objective_travel_duration, self.objective_travel_time = objectives
+            tour = ['End']
+            label = best
+            while label is not None:
+                tour.append(label[2])
+                label = label[3]
+            self.tour = tour[::-1]
@@ -1,5 +1,7 @@
+import os
 from fixtures import Fixtures
-from fixtureschedulingmodel import FixtureSchedulingModel
+from routingsolver import get_solver
+from telemetry import Telemetry, JsonLinesSink
 
 if __name__ == '__main__':
     API_football_key = "API Key"
@@ -51,11 +53,49 @@ if __name__ == '__main__':
             - Germany 
     """
 
-    fix = Fixtures(API_football_key, API_Route_Directions, league_id, year, origin_airport, league_country, min_int_match)
-    fix._pull_fixtures()
-    """ Get all fixtures for a given league and season """
+    solver_backend = 'gurobi'
+    """ Solver backend
+        Options:
+            - gurobi: mixed integer programming model, requires a Gurobi license
+            - gurobi-matrix: same model built in matrix form, faster to build for full seasons
+            - labelsetting: exact label-setting algorithm, no license needed
+            - heuristic: beam search and local search, fast but not guaranteed optimal
+            - windows: solves overlapping time windows of the season in parallel with the labelsetting backend
+    """
+
+    prune_arcs = True
+    """ Remove arcs that cannot improve a trip before building the model, within the trip duration of the heuristic """
 
-    model = FixtureSchedulingModel(fix)
+    snapshot_path = None
+    """ Fixture snapshot (.npz), e.g. 'Premier League 2022.npz'. If the file exists the fixtures are loaded from it
+        without calling any API, otherwise they are pulled and saved to it
+    """
+
+    telemetry_path = None
+    """ JSON-lines file receiving the timed phases and the Gurobi progress (incumbent, bound and gap), e.g.
+        'telemetry.jsonl'. None disables telemetry
+    """
+
+    telemetry = Telemetry(JsonLinesSink(telemetry_path)) if telemetry_path is not None else None
+    if snapshot_path is not None and os.path.exists(snapshot_path):
+        fix = Fixtures.from_snapshot(snapshot_path, API_football_key, API_Route_Directions, telemetry=telemetry)
+        """ Load the fixtures, travel times and successors of a previous run """
+    else:
+        fix = Fixtures(API_football_key, API_Route_Directions, league_id, year, origin_airport, league_country,
+                       min_int_match, telemetry=telemetry)
+        fix._pull_fixtures()
+        """ Get all fixtures for a given league and season """
+        if snapshot_path is not None:
+            fix._save_snapshot(snapshot_path)
+
+    if prune_arcs:
+        heuristic = get_solver(fix, 'heuristic')
+        heuristic._solve_model()
+        print(fix._prune_arcs(max_span=heuristic.objective_travel_duration if heuristic.tour is not None else None))
+        """ Shrink the set of arcs, hence of x variables. The heuristic trip duration bounds the optimum because
+            every backend minimizes the trip duration first """
+
+    model = get_solver(fix, solver_backend)
     model._solve_model()
     """ Solve Mathematical model """
 
@@ -65,3 +105,7 @@ if __name__ == '__main__':
 
     model._plot_maps()
     """ Plot trip flow map"""
+
+    if telemetry is not None:
+        print(telemetry.report())
+        """ Time spent in each phase, HTTP calls, cache hits and model sizes """
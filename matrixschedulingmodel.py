@@ -0,0 +1,127 @@
+import gurobipy as grb
+import numpy as np
+import scipy.sparse as sp
+from fixtureschedulingmodel import FixtureSchedulingModel
+
+
+class MatrixFixtureSchedulingModel(FixtureSchedulingModel):
+    """ FixtureSchedulingModel built in matrix form
+        The x variables are a single MVar over Fixtures.arcs and every constraint family is added at once from a
+        sparse arc-incidence matrix, in the same order and with the same coefficients as FixtureSchedulingModel, so
+        both builders give the same model and the same tour. Variable names are only set with var_names.
+        _update_model rebuilds the MVar and the constraint matrices for the new arcs instead of adding or removing
+        per-arc variables, so _add_arc_variable is not used
+    """
+    def __init__(self, Fixtures, warm_start=True, var_names=False):
+        super().__init__(Fixtures, warm_start)
+        self.var_names = var_names
+
+    def _define_variables(self):
+        """ Define model variables
+            Arcs are also indexed by the store ids of their tail and head, from the CSR arrays of Fixtures
+        """
+        """ Binary variable: 1 if match k is visited right before k2. 0 otherwise """
+        self.arcs = self.fixture.arcs
+        self.xm = self.opt_model.addMVar(len(self.arcs), vtype=grb.GRB.BINARY)
+        if self.var_names:
+            self.opt_model.setAttr('VarName', self.xm.tolist(), ["x_{0}_{1}".format(k, k2) for k, k2 in self.arcs])
+        self.tails = self.fixture.arc_tails
+        self.heads = self.fixture.arc_heads
+        self.start_index = self.fixture.store.match_index['Start']
+        self.end_index = self.fixture.store.match_index['End']
+
+    def _incidence(self, rows, n_rows):
+        """ Sparse 0/1 matrix with n_rows rows and a 1 at (rows[n], n) for every arc n with rows[n] >= 0
+        """
+        keep = np.flatnonzero(rows >= 0)
+        return sp.csr_matrix((np.ones(len(keep)), (rows[keep], keep)), shape=(n_rows, len(self.arcs)))
+
+    def _define_constraints(self):
+        """ Define model constraints from sparse incidence matrices
+        """
+        store = self.fixture.store
+        dummy = np.isin(np.arange(len(store)), [self.start_index, self.end_index])
+        in_model = np.zeros(len(store), dtype=bool)
+        in_model[[store.match_index[k] for k in self.fixture.matches_id]] = True
+        match_row = np.where(in_model & ~dummy, np.cumsum(in_model & ~dummy) - 1, -1)
+        n_matches = int((in_model & ~dummy).sum())
+        teams = [i for i in self.fixture.teams_id if i != self.fixture.airport_origin]
+        team_rows = np.full(len(store.team_names), -1)
+        team_rows[[store.team_index[team] for team in teams]] = np.arange(len(teams))
+        team_row = team_rows[store.home]
+
+        inbound = self._incidence(match_row[self.heads], n_matches)
+        outbound = self._incidence(match_row[self.tails], n_matches)
+        inbound_matches = self._incidence(np.where(dummy[self.tails], -1, match_row[self.heads]), n_matches)
+        outbound_matches = self._incidence(np.where(dummy[self.heads], -1, match_row[self.tails]), n_matches)
+        inbound_team = self._incidence(team_row[self.heads], len(teams))
+
+        """ Constraint 1 - the trip must start at a dummy match called Start """
+        start = self._incidence(np.where(self.tails == self.start_index, 0, -1), 1)
+        self.c1 = self.opt_model.addMConstr(start, self.xm, '=', np.ones(1), name="c1")
+
+        """ Constraint 2 - the trip must end at a dummy match called End """
+        end = self._incidence(np.where((self.heads == self.end_index) & ~dummy[self.tails], 0, -1), 1)
+        self.c2 = self.opt_model.addMConstr(end, self.xm, '=', np.ones(1), name="c2")
+
+        """ Constraint 3 - Flow conservation constraint - a trip consists on a sequence of matches """
+        self.c3 = self.opt_model.addMConstr(inbound - outbound, self.xm, '=', np.zeros(n_matches), name="c3")
+
+        """ Constraint 4 - No more than 1 outbound match from a match """
+        self.c4 = self.opt_model.addMConstr(outbound_matches, self.xm, '<', np.ones(n_matches), name="c4")
+
+        """ Constraint 5 - No more than 1 inbound to from a match """
+        self.c5 = self.opt_model.addMConstr(inbound_matches, self.xm, '<', np.ones(n_matches), name="c5")
+
+        """ Constraint 6 - All stadiums must be visited exactly once"""
+        self.c6 = self.opt_model.addMConstr(inbound_team, self.xm, '=', np.ones(len(teams)), name="c6")
+
+    def _define_objective_function(self):
+        """ Define objective function
+        """
+        start_hours = self.fixture.store.start_hours
+        location = self.fixture.store.home
+
+        """ Objective function 1 - minimize difference between first and last match of the trip """
+        duration = np.where(self.heads == self.end_index, start_hours[self.tails], 0) - \
+            np.where(self.tails == self.start_index, start_hours[self.heads], 0)
+        self.objective_travel_duration = duration @ self.xm
+
+        """ Objective function 2 - minimize total travel time """
+        travel = self.fixture.travel_matrix[location[self.tails], location[self.heads]]
+        self.objective_travel_time = travel @ self.xm
+
+    def _set_warm_start(self):
+        """ Set the Start attribute of the x variables to the tour built by the construction heuristic
+        """
+        tour = self._heuristic_tour()
+        if tour is not None:
+            arcs = set(zip(tour, tour[1:]))
+            self.xm.Start = np.array([1 if arc in arcs else 0 for arc in self.arcs])
+
+    def _extract_tour(self):
+        """ Follow the arcs chosen by the mathematical model from Start to End
+        """
+        next_match = {self.arcs[n][0]: self.arcs[n][1] for n in np.flatnonzero(self.xm.X > 0.1)}
+        tour = ['Start']
+        while tour[-1] != 'End':
+            tour.append(next_match[tour[-1]])
+        return tour
+
+    def _update_model(self, changes):
+        """ Re-solve after matches are rescheduled, rebuilding the variables and constraints of opt_model
+            changes is passed to Fixtures._update_fixtures. The model keeps its parameters, and the arcs of the
+            previous tour that still exist are given as a partial MIP start
+        """
+        removed, added = self.fixture._update_fixtures(changes)
+        self.opt_model.remove(self.opt_model.getConstrs())
+        self.opt_model.remove(self.opt_model.getVars())
+        self._define_variables()
+        self._define_constraints()
+        self._define_objective_function()
+        self._set_objective_function()
+        if self.tour is not None:
+            arcs = set(zip(self.tour, self.tour[1:]))
+            self.xm.Start = np.array([1 if arc in arcs else grb.GRB.UNDEFINED for arc in self.arcs])
+        self._optimize()
+        return removed, added
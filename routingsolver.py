@@ -0,0 +1,118 @@
+import importlib
+import json
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from utils import pull_directions_stream, create_map
+
+SOLVERS = {
+    'gurobi': ('fixtureschedulingmodel', 'FixtureSchedulingModel'),
+    'gurobi-matrix': ('matrixschedulingmodel', 'MatrixFixtureSchedulingModel'),
+    'labelsetting': ('labelsettingmodel', 'LabelSettingModel'),
+    'heuristic': ('heuristicmodel', 'HeuristicModel'),
+    'windows': ('windowsolver', 'WindowSolver'),
+}
+""" Solver backends by name, as (module, class) so gurobipy is only imported when its backend is used """
+
+
+def get_solver(Fixtures, backend='gurobi', **kwargs):
+    """ Create the solver of a backend listed in SOLVERS for the given fixtures
+    """
+    module_name, class_name = SOLVERS[backend]
+    return getattr(importlib.import_module(module_name), class_name)(Fixtures, **kwargs)
+
+
+class RoutingSolver:
+    """ Base class of the match routing problem solvers
+        _solve_model must set self.tour, the list of visited matches from Start to End.
+        Outputs and maps are built from the tour, so every backend shares _get_outputs and _plot_maps.
+        Phases are timed in the telemetry of the fixtures
+    """
+    def __init__(self, Fixtures):
+        self.fixture = Fixtures
+        self.telemetry = Fixtures.telemetry
+        self.tour = None
+
+    def _solve_model(self):
+        """ Solve the problem and set self.tour
+        """
+        raise NotImplementedError
+
+    def _index_teams(self):
+        """ Give each team a bit of the visited-teams mask and sort its home matches by kick-off
+        """
+        start_hours = self.fixture.fixtures_dict['start hours']
+        home_team = self.fixture.fixtures_dict['home team']
+        self.team_bit = {team: 1 << n for n, team in enumerate(self.fixture.teams_id)}
+        self.full_mask = (1 << len(self.team_bit)) - 1
+        self.home_matches = {team: sorted(self.fixture.matches_team[team], key=lambda k: start_hours[k])
+                             for team in self.team_bit}
+        self.home_starts = {team: [start_hours[k] for k in self.home_matches[team]] for team in self.team_bit}
+        self.order = sorted((k for k in self.fixture.matches_id if home_team[k] in self.team_bit),
+                            key=lambda k: start_hours[k])
+
+    def _last_start_bound(self, start, mask):
+        """ Earliest kick-off by which every team outside mask can have been visited after a match at start
+            Each of them must play at home at least min_int_match hours after start, and consecutive matches of a trip
+            are at least min_int_match hours apart. Returns None if some team has no home match left
+        """
+        min_int_match = self.fixture.min_int_match
+        bound = start
+        remaining = 0
+        for team, bit in self.team_bit.items():
+            if not mask & bit:
+                starts = self.home_starts[team]
+                n = bisect_left(starts, start + min_int_match)
+                if n == len(starts):
+                    return None
+                bound = max(bound, starts[n])
+                remaining += 1
+        return max(bound, start + remaining * min_int_match)
+
+    def _tour_objectives(self, tour=None):
+        """ Trip duration (objective 1) and total travel time (objective 2) of a tour, by default self.tour
+        """
+        tour = self.tour if tour is None else tour
+        start_hours = self.fixture.fixtures_dict['start hours']
+        home_team = self.fixture.fixtures_dict['home team']
+        travel_duration = start_hours[tour[-2]] - start_hours[tour[1]]
+        travel_time = sum(self.fixture.travel_times[(home_team[k], home_team[k2])] for k, k2 in zip(tour, tour[1:]))
+        return travel_duration, travel_time
+
+    def _get_outputs(self):
+        """ Sort matches of the tour by date
+            Columns are read from the fixture store by the integer ids of the tour
+        """
+        with self.telemetry.span('outputs'):
+            store = self.fixture.store
+            rows = np.array([store.match_index[k] for k in self.tour])
+            dates = store.dates[rows].tolist()
+            dates[0] = dates[1] - timedelta(days=1)
+            dates[-1] = dates[-2] + timedelta(days=1)
+            schedule_dict = {'Match': self.tour,
+                             'Stadium Name': store.stadium_name[rows],
+                             'Stadium City': store.stadium_city[rows],
+                             'Stadium Lat': store.lat[rows],
+                             'Stadium Lon': store.lon[rows],
+                             'Home Team': [store.team_names[n] for n in store.home[rows]],
+                             'Away Team': [store.team_names[n] for n in store.away[rows]],
+                             'Match Date': [date.strftime('%Y-%m-%d %H:%M') for date in dates]}
+            self.output_schedule = pd.DataFrame.from_dict(schedule_dict)
+            self.output_schedule = self.output_schedule.sort_values(by='Match Date', ascending=True)
+            self.output_schedule.to_csv("Output Schedule.csv", index=False)
+
+    def _plot_maps(self, tolerance=None):
+        """ Save the route map of the trip to route_map.html and its GeoJSON to route_map.geojson
+            Legs are drawn as their routes arrive, from the cache first. With tolerance, in degrees, routes are
+            simplified before being drawn
+        """
+        lat_lons = list(zip(self.output_schedule['Stadium Lat'], self.output_schedule['Stadium Lon']))
+        pairs = [(lat_lons[n][0], lat_lons[n][1], lat_lons[n + 1][0], lat_lons[n + 1][1])
+                 for n in range(len(lat_lons) - 1)]
+        with self.telemetry.span('route map'):
+            legs = pull_directions_stream(pairs, self.fixture.route_api_key, self.fixture.cache, self.fixture.client)
+            m, geojson = create_map(legs, lat_lons, tolerance, list(self.output_schedule['Match']))
+            m.save('./route_map.html')
+            with open('./route_map.geojson', 'w') as f:
+                f.write(json.dumps(geojson))
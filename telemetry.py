@@ -0,0 +1,116 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Telemetry:
+    """ Timed spans and counters of a run, shared by Fixtures, its HTTP client and cache and the solvers
+        Every span and solver progress record is also sent to sink, any callable taking a dict such as JsonLinesSink
+        or LoggerSink. Counters are kept in counters, spans in spans as (name, seconds) pairs
+    """
+    enabled = True
+
+    def __init__(self, sink=None, progress_interval=1.0):
+        self.sink = sink
+        self.progress_interval = progress_interval
+        self.spans = []
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """ Time the enclosed block as a span called name
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            with self.lock:
+                self.spans.append((name, seconds))
+            self.emit({'event': 'span', 'name': name, 'seconds': seconds})
+
+    def count(self, name, n=1):
+        """ Add n to the counter called name
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        """ Set the counter called name to value, for sizes such as the number of arcs
+        """
+        with self.lock:
+            self.counters[name] = value
+
+    def emit(self, record):
+        """ Send a record to the sink, with the current time
+        """
+        if self.sink is not None:
+            self.sink(dict(record, time=time.time()))
+
+    def report(self):
+        """ Total seconds of each span name, in order of first appearance, and the counters
+        """
+        totals = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0) + seconds
+        return {'spans': totals, 'counters': dict(self.counters)}
+
+
+class NullTelemetry(Telemetry):
+    """ Disabled telemetry, every call is a no-op
+        It holds no lock or sink, and pickles as NULL_TELEMETRY so fixtures views can be sent to other processes
+    """
+    enabled = False
+
+    def __init__(self):
+        self.sink = None
+        self.progress_interval = None
+        self.spans = []
+        self.counters = {}
+        self._span = nullcontext()
+
+    def __reduce__(self):
+        return 'NULL_TELEMETRY'
+
+    def span(self, name):
+        return self._span
+
+    def count(self, name, n=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def emit(self, record):
+        pass
+
+
+NULL_TELEMETRY = NullTelemetry()
+""" Telemetry used when none is given """
+
+
+class JsonLinesSink:
+    """ Sink appending each record to a file as a line of JSON
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock, open(self.path, 'a') as f:
+            f.write(line)
+
+
+class LoggerSink:
+    """ Sink logging each record as JSON at level
+    """
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('match_routing')
+        self.level = level
+
+    def __call__(self, record):
+        self.logger.log(self.level, json.dumps(record, default=str))
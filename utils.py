@@ -1,56 +1,234 @@
-from math import radians, cos, sin, asin, sqrt
-import requests
-import json
+from math import radians, cos
+from collections.abc import Mapping
 import folium
-import pandas as pd
+import numpy as np
+from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
+from cache import route_key
+from httpclient import default_client
 
-def pull_directions_api(lat1, lon1, lat2, lon2, route_api_key):
-    url = "https://route-and-directions.p.rapidapi.com/v1/routing"
-    host = "route-and-directions.p.rapidapi.com"
-    headers = {"X-RapidAPI-Key": route_api_key, "X-RapidAPI-Host": host}
+ROUTE_URL = "https://route-and-directions.p.rapidapi.com/v1/routing"
+ROUTE_HOST = "route-and-directions.p.rapidapi.com"
+_MISSING = object()
+
+
+def geocode(geolocator, query, cache=None, client=None):
+    """ Geocode a place name, reading from the cache first
+        Returns a (lat, lon) tuple, or None if the place could not be found
+    """
+    if cache is not None:
+        location = cache.get('geocode', query, _MISSING)
+        if location is not _MISSING:
+            return None if location is None else tuple(location)
+    client = client or default_client()
+    result = client.call('nominatim', geolocator.geocode, query, timeout=2,
+                         retry_on=(GeocoderTimedOut, GeocoderUnavailable))
+    location = None if result is None else (result.latitude, result.longitude)
+    if cache is not None:
+        cache.set('geocode', query, location)
+    return location
+
+
+def geocode_batch(geolocator, queries, cache=None, client=None):
+    """ Geocode a list of place names concurrently, within the Nominatim rate limit
+        Returns the (lat, lon) tuples (or None) in the order of queries
+    """
+    client = client or default_client()
+    return client.map(lambda query: geocode(geolocator, query, cache, client), queries)
+
+
+def pull_directions_api(lat1, lon1, lat2, lon2, route_api_key, cache=None, client=None):
+    if cache is not None:
+        res = cache.get('route', route_key(lat1, lon1, lat2, lon2, 'drive'))
+        if res is not None:
+            return res
+    return _fetch_directions(lat1, lon1, lat2, lon2, route_api_key, cache, client)
+
+
+def _fetch_directions(lat1, lon1, lat2, lon2, route_api_key, cache=None, client=None):
+    """ Pull a route from the Route and Directions API and store it in the cache
+    """
+    client = client or default_client()
+    headers = {"X-RapidAPI-Key": route_api_key, "X-RapidAPI-Host": ROUTE_HOST}
     querystring = {"waypoints": f"{str(lat1)},{str(lon1)}|{str(lat2)},{str(lon2)}", "mode": 'drive'}
-    response = requests.request("GET", url, headers=headers, params=querystring)
-    res = json.loads(response.text)
+    res = client.get_json(ROUTE_URL, params=querystring, headers=headers, provider='route')
+    if cache is not None and 'features' in res:
+        cache.set('route', route_key(lat1, lon1, lat2, lon2, 'drive'), res)
     return res
 
 
-def time_calculator(lat1, lon1, lat2, lon2, route_api_key=None):
-    """ Calculate travel time between two locations using
+def pull_directions_batch(pairs, route_api_key, cache=None, client=None):
+    """ Pull the routes of a list of (lat1, lon1, lat2, lon2) pairs concurrently
+        Returns the responses in the order of pairs
+    """
+    client = client or default_client()
+    return client.map(lambda pair: pull_directions_api(*pair, route_api_key, cache, client), pairs)
+
+
+def pull_directions_stream(pairs, route_api_key, cache=None, client=None):
+    """ Pull the routes of a list of (lat1, lon1, lat2, lon2) pairs, yielding (n, response) as each route arrives
+        Routes found in the cache are yielded first, the others are pulled concurrently in completion order
+    """
+    client = client or default_client()
+    pending = []
+    for n, pair in enumerate(pairs):
+        res = cache.get('route', route_key(*pair, 'drive')) if cache is not None else None
+        if res is not None:
+            yield n, res
+        else:
+            pending.append(n)
+    yield from client.map_unordered(
+        lambda n: (n, _fetch_directions(*pairs[n], route_api_key, cache, client)), pending)
+
+
+def route_time_matrix(lats, lons, route_api_key, cache=None, client=None):
+    """ Calculate travel times in hours between every pair of locations using Route and directions API, mode drive
+    """
+    pairs = [(i, j) for i in range(len(lats)) for j in range(len(lats)) if i != j]
+    responses = pull_directions_batch([(lats[i], lons[i], lats[j], lons[j]) for i, j in pairs], route_api_key,
+                                      cache, client)
+    times = np.zeros((len(lats), len(lats)))
+    for (i, j), res in zip(pairs, responses):
+        times[i, j] = res['features'][0]['properties']['time'] / (60 * 60)
+    return times
+
+
+def time_calculator(lat1, lon1, lat2, lon2, route_api_key=None, cache=None, client=None):
+    """ Calculate travel time in hours between two locations using
         - Haversine Distance and Average Speed of 60km/h if Route API Key is not passed
         - Using Route and directions API, mode drive
-            (https://rapidapi.com/geoapify-gmbh-geoapify/api/route-and-directions)
+            (https://rapidapi.com/geoapify-gmbh-geoapify/api/route-and-directions), reading from cache first
+        Kept for single pairs, travel_time_row and the matrix functions compute many at once
+    """
+    if route_api_key is None:
+        return float(travel_time_row(lat1, lon1, [lat2], [lon2])[0][0])
+    res = pull_directions_api(lat1, lon1, lat2, lon2, route_api_key, cache, client)
+    return res['features'][0]['properties']['time'] / (60 * 60)
+
+
+def haversine_matrix(lats, lons, speed=60):
+    """ Calculate travel times between every pair of locations at once using
+        Haversine Distance and Average Speed of 60km/h
+        Returns a square array where entry [i, j] is the time in hours from location i to location j
+    """
+    R = 6372.8
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    i, j = np.triu_indices(len(lats), k=1)
+    dLat = np.radians(lats[j] - lats[i])
+    dLon = np.radians(lons[j] - lons[i])
+    lat1 = np.radians(lats[i])
+    lat2 = np.radians(lats[j])
+    a = np.sin(dLat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dLon / 2) ** 2
+    km = R * 2 * np.arcsin(np.sqrt(a))
+    times = np.zeros((len(lats), len(lats)))
+    times[i, j] = km / speed
+    times[j, i] = times[i, j]
+    return times
+
+
+def travel_time_row(lat, lon, lats, lons, route_api_key=None, cache=None, client=None, speed=60):
+    """ Calculate travel times in hours from one location to many and back
+        Uses Haversine Distance and Average Speed of 60km/h if Route API Key is not passed, Route and directions API
+        otherwise. Returns the arrays of times from (lat, lon) to each location and from each location to (lat, lon)
     """
     if route_api_key is None:
-        speed = 60
         R = 6372.8
-        dLat = radians(lat2 - lat1)
-        dLon = radians(lon2 - lon1)
-        lat1 = radians(lat1)
-        lat2 = radians(lat2)
-        a = sin(dLat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dLon / 2) ** 2
-        c = 2 * asin(sqrt(a))
-        km = R * c
-        time_hours = km / speed
-    else:
-        res = pull_directions_api(lat1, lon1, lat2, lon2, route_api_key)
-        time_hours = res['features'][0]['properties']['time'] / (60 * 60)
-    return time_hours
-
-
-def create_map(responses, lat_lons):
+        lats = np.radians(np.asarray(lats, dtype=float))
+        lons = np.radians(np.asarray(lons, dtype=float))
+        lat, lon = radians(lat), radians(lon)
+        a = np.sin((lats - lat) / 2) ** 2 + cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+        times = R * 2 * np.arcsin(np.sqrt(a)) / speed
+        return times, times.copy()
+    pairs = [(lat, lon, lat2, lon2) for lat2, lon2 in zip(lats, lons)]
+    pairs += [(lat2, lon2, lat, lon) for lat2, lon2 in zip(lats, lons)]
+    responses = pull_directions_batch(pairs, route_api_key, cache, client)
+    times = np.array([res['features'][0]['properties']['time'] / (60 * 60) for res in responses])
+    return times[:len(lats)], times[len(lats):]
+
+
+class TravelTimes(Mapping):
+    """ Read-only dict view of a travel time matrix, keyed by (origin, destination) location names
+    """
+    def __init__(self, matrix, index):
+        self.matrix = matrix
+        self.index = index
+
+    def __getitem__(self, key):
+        origin, destination = key
+        return float(self.matrix[self.index[origin], self.index[destination]])
+
+    def __iter__(self):
+        for origin in self.index:
+            for destination in self.index:
+                yield origin, destination
+
+    def __len__(self):
+        return len(self.index) ** 2
+
+
+def simplify_polyline(points, tolerance):
+    """ Douglas-Peucker simplification of an (n, 2) array of points
+        Keeps the end points and every point farther than tolerance from the simplified line, in the units of points
+    """
+    points = np.asarray(points, dtype=float)
+    if not tolerance or len(points) < 3:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment = points[last] - points[first]
+        offsets = points[first + 1:last] - points[first]
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        n = int(np.argmax(distances))
+        if distances[n] > tolerance:
+            n += first + 1
+            keep[n] = True
+            stack += [(first, n), (n, last)]
+    return points[keep]
+
+
+def create_map(legs, lat_lons, tolerance=None, names=None):
+    """ Folium map of a trip with a marker per stadium and the route of each leg, and its GeoJSON
+        legs yields (leg number, Route and Directions response) pairs in any order, such as pull_directions_stream,
+        and each leg is added as it arrives while the bounds are kept as a running box. With tolerance, in degrees,
+        routes are simplified by simplify_polyline first. Legs without a route are left out.
+        Returns the map and a GeoJSON FeatureCollection of the stadiums (named by names) and the legs
+    """
     m = folium.Map()
-    df = pd.DataFrame()
-    for point in lat_lons:
+    features = []
+    for n, point in enumerate(lat_lons):
         folium.Marker(point).add_to(m)
-    for response in responses:
-        mls = response['features'][0]['geometry']['coordinates']
-        points = [(i[1], i[0]) for i in mls[0]]
-        folium.PolyLine(points, weight=5, opacity=1).add_to(m)
-        temp = pd.DataFrame(mls[0]).rename(columns={0: 'Lon', 1: 'Lat'})[['Lat', 'Lon']]
-        df = pd.concat([df, temp])
-    sw = df[['Lat', 'Lon']].min().values.tolist()
-    sw = [sw[0] - 0.0005, sw[1] - 0.0005]
-    ne = df[['Lat', 'Lon']].max().values.tolist()
-    ne = [ne[0] + 0.0005, ne[1] + 0.0005]
-    m.fit_bounds([sw, ne])
-    return m
\ No newline at end of file
+        features.append({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [point[1], point[0]]},
+                         'properties': {'stop': n, 'name': names[n] if names is not None else None}})
+    sw, ne = None, None
+    legs_features = {}
+    for n, response in legs:
+        if not response.get('features'):
+            continue
+        lines = []
+        for line in response['features'][0]['geometry']['coordinates']:
+            points = np.asarray(line, dtype=float)
+            if tolerance:
+                points = simplify_polyline(points, tolerance)
+                line = points.tolist()
+            folium.PolyLine([(lat, lon) for lon, lat in line], weight=5, opacity=1).add_to(m)
+            low, high = points.min(axis=0)[::-1], points.max(axis=0)[::-1]
+            sw = low if sw is None else np.minimum(sw, low)
+            ne = high if ne is None else np.maximum(ne, high)
+            lines.append(line)
+        legs_features[n] = {'type': 'Feature', 'geometry': {'type': 'MultiLineString', 'coordinates': lines},
+                            'properties': {'leg': n}}
+    features += [legs_features[n] for n in sorted(legs_features)]
+    if sw is None and lat_lons:
+        sw, ne = np.min(lat_lons, axis=0), np.max(lat_lons, axis=0)
+    if sw is not None:
+        m.fit_bounds([(sw - 0.0005).tolist(), (ne + 0.0005).tolist()])
+    return m, {'type': 'FeatureCollection', 'features': features}
@@ -0,0 +1,104 @@
+import os
+from math import ceil
+from concurrent.futures import ProcessPoolExecutor
+from routingsolver import RoutingSolver, get_solver
+from heuristicmodel import HeuristicModel
+
+
+def _solve_window(view, solver, solver_kwargs):
+    """ Solve a window of the fixtures in a worker process and return its tour, or None if it has no trip
+    """
+    model = get_solver(view, solver, **solver_kwargs)
+    model._solve_model()
+    return model.tour
+
+
+class WindowSolver(RoutingSolver):
+    """ Sliding time-window decomposition of the match routing problem
+        The season is split into windows of window_days days starting every step_days days, so any trip shorter
+        than window_days - step_days days lies entirely inside a window. Each window is solved on a reduced view
+        of the fixtures by the solver backend, in a pool of processes, and the best tour over all windows is kept.
+        The tour of HeuristicModel is the first incumbent and, when window_days is None, sets the window length to
+        its trip duration plus step_days, so the best tour over the windows is the optimum of the solver backend.
+        Windows are submitted by increasing lower bound on the trip duration, processes at a time, and windows whose
+        lower bound is above the trip duration of the incumbent are skipped
+    """
+    def __init__(self, Fixtures, window_days=None, step_days=7, solver='labelsetting', processes=None, **solver_kwargs):
+        super().__init__(Fixtures)
+        self.window_days = window_days
+        self.step_days = step_days
+        self.solver = solver
+        self.processes = processes
+        self.solver_kwargs = solver_kwargs
+        self.windows_solved = 0
+        self.windows_skipped = 0
+
+    def _windows(self, window_days):
+        """ List the (start, end) hours of the windows of window_days days covering the season
+        """
+        start_hours = self.fixture.fixtures_dict['start hours']
+        last = max(start_hours[k] for k in self.order)
+        windows = []
+        start = min(start_hours[k] for k in self.order)
+        while True:
+            windows.append((start, start + window_days * 24))
+            if start + window_days * 24 >= last:
+                return windows
+            start += self.step_days * 24
+
+    def _window_bound(self, start, end):
+        """ Lower bound on the trip duration of the trips inside a window, None if the window holds no trip
+            A trip starting at a match f cannot end before every other team has played at home after f
+        """
+        start_hours = self.fixture.fixtures_dict['start hours']
+        home_team = self.fixture.fixtures_dict['home team']
+        bound = None
+        for k in self.order:
+            if start <= start_hours[k] <= end:
+                last_start = self._last_start_bound(start_hours[k], self.team_bit[home_team[k]])
+                if last_start is not None and last_start <= end:
+                    duration = last_start - start_hours[k]
+                    bound = duration if bound is None else min(bound, duration)
+        return bound
+
+    def _solve_model(self):
+        """ Solve the windows in a process pool, best lower bound first, and keep the best tour
+        """
+        self._index_teams()
+        heuristic = HeuristicModel(self.fixture)
+        with self.telemetry.span('heuristic'):
+            heuristic._solve_model()
+        best_objectives = (float('inf'), float('inf'))
+        if heuristic.tour is not None:
+            self.tour, best_objectives = heuristic.tour, self._tour_objectives(heuristic.tour)
+        window_days = self.window_days
+        if window_days is None:
+            window_days = ceil(best_objectives[0] / 24) + self.step_days if heuristic.tour is not None else float('inf')
+
+        windows = []
+        for start, end in self._windows(window_days):
+            bound = self._window_bound(start, end)
+            if bound is None:
+                self.windows_skipped += 1
+            else:
+                windows.append((bound, start, end))
+        windows.sort()
+
+        with self.telemetry.span('windows'):
+            processes = self.processes or os.cpu_count()
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                for n in range(0, len(windows), processes):
+                    batch = [(start, end) for bound, start, end in windows[n:n + processes]
+                             if bound <= best_objectives[0]]
+                    self.windows_skipped += len(windows[n:n + processes]) - len(batch)
+                    futures = [executor.submit(_solve_window, self.fixture._window(start, end), self.solver,
+                                               self.solver_kwargs) for start, end in batch]
+                    for future in futures:
+                        tour = future.result()
+                        self.windows_solved += 1
+                        if tour is not None and self._tour_objectives(tour) < best_objectives:
+                            self.tour, best_objectives = tour, self._tour_objectives(tour)
+        self.telemetry.gauge('windows solved', self.windows_solved)
+        self.telemetry.gauge('windows skipped', self.windows_skipped)
+        if self.tour is not None:
+            self.objective_travel_duration, self.objective_travel_time = best_objectives